@@ -0,0 +1,635 @@
+from time import perf_counter
+from math import log, sqrt
+from random import Random
+from struct import pack, unpack
+import os
+import pickle
+import sys
+import chess
+import chess.polyglot
+from cache import LRUCache
+from engines import FULL_BOARD, HAS_LINE
+
+# computer opponents. everything in here runs in worker processes, so it only
+# takes and returns plain data and never imports main.py. main.py starts each
+# worker as python -c "import ai; ai.serve()"
+
+# whether the last search found what this worker kept from the game's previous
+# move, by cache. sent back with every reply so main.py can count hits
+REUSED = {}
+
+
+class Timeout(Exception):
+    pass
+
+
+# connect four positions are two ints: the stones of the player to move and the
+# stones of both players. column c uses bits c * (height + 1) up to
+# c * (height + 1) + height - 1, bottom first, with one empty bit on top so
+# shifting a line never wraps into the next column
+WIN = 1000
+# transposition tables per board size, kept between searches in the same worker
+CONNECT_FOUR_TABLES = {}
+CONNECT_FOUR_TABLE_SIZE = 1 << 20
+
+
+class ConnectFourSearch:
+    def __init__(self, width, height, deadline):
+        self.width = width
+        self.height = height
+        self.cells = width * height
+        self.bottom = sum(1 << (c * (height + 1)) for c in range(width))
+        self.board_mask = self.bottom * ((1 << height) - 1)
+        self.columns = [
+            ((1 << height) - 1) << (c * (height + 1)) for c in range(width)
+        ]
+        # middle columns first, they're part of the most lines
+        self.order = sorted(range(width), key=lambda c: abs(width // 2 - c))
+        self.deadline = deadline
+        self.nodes = 0
+        self.table = CONNECT_FOUR_TABLES.setdefault((width, height), {})
+        if len(self.table) > CONNECT_FOUR_TABLE_SIZE:
+            self.table.clear()
+
+    def winning_cells(self, position, mask):
+        # empty cells that would finish a line of four for position
+        h = self.height
+        cells = (position << 1) & (position << 2) & (position << 3)
+        for shift in (h + 1, h, h + 2):
+            pair = (position << shift) & (position << 2 * shift)
+            cells |= pair & (position << 3 * shift)
+            cells |= pair & (position >> shift)
+            pair = (position >> shift) & (position >> 2 * shift)
+            cells |= pair & (position << shift)
+            cells |= pair & (position >> 3 * shift)
+        return cells & (self.board_mask ^ mask)
+
+    def ordered(self, position, mask, possible, first):
+        moves = []
+        for (rank, column) in enumerate(self.order):
+            bit = possible & self.columns[column]
+            if bit:
+                threats = self.winning_cells(position | bit, mask | bit)
+                threats = bin(threats).count("1")
+                moves.append((column != first, -threats, rank, column, bit))
+        moves.sort()
+        return [(column, bit) for (_, _, _, column, bit) in moves]
+
+    def negamax(self, position, mask, moves, depth, alpha, beta):
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and perf_counter() > self.deadline:
+            raise Timeout()
+        possible = (mask + self.bottom) & self.board_mask
+        mine = self.winning_cells(position, mask)
+        if possible & mine:
+            return WIN + (self.cells + 1 - moves) // 2
+        theirs = self.winning_cells(position ^ mask, mask)
+        forced = possible & theirs
+        if forced:
+            if forced & (forced - 1):
+                # two threats at once, one of them gets through
+                return -(WIN + (self.cells - moves) // 2)
+            possible = forced
+        # never play right under a cell the opponent wins on
+        possible &= ~(theirs >> 1)
+        if not possible:
+            return -(WIN + (self.cells - moves) // 2)
+        if moves >= self.cells - 2:
+            return 0
+        if depth == 0:
+            return bin(mine).count("1") - bin(theirs).count("1")
+        key = position + mask
+        entry = self.table.get(key)
+        first = None
+        if entry is not None:
+            (stored, flag, value, first) = entry
+            if stored >= depth:
+                if flag == 0:
+                    return value
+                if flag < 0:
+                    beta = min(beta, value)
+                else:
+                    alpha = max(alpha, value)
+                if alpha >= beta:
+                    return value
+        start = alpha
+        best = -WIN * 2
+        best_column = None
+        opponent = position ^ mask
+        for (column, bit) in self.ordered(position, mask, possible, first):
+            score = -self.negamax(
+                opponent, mask | bit, moves + 1, depth - 1, -beta, -alpha
+            )
+            if score > best:
+                best = score
+                best_column = column
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+        # flag: 0 exact, 1 lower bound, -1 upper bound
+        flag = 0
+        if best <= start:
+            flag = -1
+        elif best >= beta:
+            flag = 1
+        self.table[key] = (depth, flag, best, best_column)
+        return best
+
+    def best_move(self, position, mask, moves, max_depth):
+        # iterative deepening, a search that runs out of time is thrown away and
+        # the last finished depth decides
+        best = None
+        for depth in range(1, max_depth + 1):
+            try:
+                self.negamax(position, mask, moves, depth, -WIN * 2, WIN * 2)
+            except Timeout:
+                break
+            entry = self.table.get(position + mask)
+            if entry is None:
+                # decided before any move was searched
+                break
+            (_, _, score, column) = entry
+            if column is not None:
+                best = column
+            if abs(score) >= WIN:
+                break
+        return best
+
+
+def connect_four_move(board, turn, seconds=1.0, depth=None):
+    # board[column][row] with row 0 at the bottom, as in engines.ConnectFour.
+    # returns the column for the player whose turn it is
+    width = len(board)
+    height = len(board[0])
+    search = ConnectFourSearch(width, height, perf_counter() + seconds)
+    position = 0
+    mask = 0
+    for (column, cells) in enumerate(board):
+        for (row, cell) in enumerate(cells):
+            if cell is not None:
+                bit = 1 << (column * (height + 1) + row)
+                mask |= bit
+                if cell == turn:
+                    position |= bit
+    moves = bin(mask).count("1")
+    possible = (mask + search.bottom) & search.board_mask
+    # a win or a forced block needs no search
+    wins = possible & search.winning_cells(position, mask)
+    blocks = possible & search.winning_cells(position ^ mask, mask)
+    for bits in (wins, blocks):
+        if bits:
+            return next(c for c in search.order if bits & search.columns[c])
+    if depth is None:
+        depth = search.cells - moves
+    column = search.best_move(position, mask, moves, depth)
+    if column is None:
+        # lost whatever happens, or no time for even one ply
+        column = next(c for c in search.order if possible & search.columns[c])
+    return column
+
+
+# chess. scores are in centipawns for the side to move, material plus the piece
+# square tables from the "simplified evaluation function", written from white's
+# side with a8 first so a white piece on square s reads entry s ^ 56
+PIECE_VALUES = [0, 100, 320, 330, 500, 900, 20000]
+# fmt: off
+PIECE_SQUARES = [
+    None,
+    # pawn
+    [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    # knight
+    [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    # bishop
+    [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    # rook
+    [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ],
+    # queen
+    [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ],
+    # king, middle game
+    [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ],
+]
+# fmt: on
+MATE = 100000
+# scores this close to MATE are mates, stored relative to the node
+MATED = MATE - 1000
+# transposition tables per game, kept between moves. main.py sends every move
+# of a game to the same worker
+CHESS_TABLES = LRUCache(maxsize=32)
+CHESS_TABLE_SIZE = 1 << 19
+
+
+class ChessSearch:
+    def __init__(self, table, deadline):
+        self.table = table
+        self.deadline = deadline
+        self.nodes = 0
+        self.killers = {}
+        # the first iteration always finishes so there is a move to play
+        self.can_stop = False
+
+    def tick(self):
+        self.nodes += 1
+        if self.can_stop and self.nodes & 255 == 0 and perf_counter() > self.deadline:
+            raise Timeout()
+
+    def evaluate(self, board):
+        score = 0
+        for piece in range(chess.PAWN, chess.KING + 1):
+            value = PIECE_VALUES[piece]
+            squares = PIECE_SQUARES[piece]
+            pieces = board.pieces_mask(piece, chess.WHITE)
+            for square in chess.scan_forward(pieces):
+                score += value + squares[square ^ 56]
+            pieces = board.pieces_mask(piece, chess.BLACK)
+            for square in chess.scan_forward(pieces):
+                score -= value + squares[square]
+        if board.turn == chess.WHITE:
+            return score
+        return -score
+
+    def capture_order(self, board, move):
+        # most valuable victim, then least valuable attacker
+        victim = board.piece_type_at(move.to_square) or chess.PAWN
+        return 10 * victim - board.piece_type_at(move.from_square)
+
+    def ordered(self, board, first, ply):
+        killers = self.killers.get(ply, ())
+        scored = []
+        for move in board.legal_moves:
+            if move == first:
+                rank = 1000
+            elif board.is_capture(move):
+                rank = 100 + self.capture_order(board, move)
+            elif move.promotion:
+                rank = 90
+            elif move in killers:
+                rank = 50
+            else:
+                rank = 0
+            scored.append((rank, move))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [move for (_, move) in scored]
+
+    def quiesce(self, board, alpha, beta):
+        # only captures past the search depth, so a position isn't scored in the
+        # middle of a trade
+        self.tick()
+        stand = self.evaluate(board)
+        if stand >= beta:
+            return stand
+        alpha = max(alpha, stand)
+        captures = sorted(
+            board.generate_legal_captures(),
+            key=lambda move: self.capture_order(board, move),
+            reverse=True,
+        )
+        for move in captures:
+            board.push(move)
+            score = -self.quiesce(board, -beta, -alpha)
+            board.pop()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def search(self, board, depth, alpha, beta, ply):
+        self.tick()
+        check = board.is_check()
+        if check:
+            depth += 1
+        if depth <= 0:
+            return self.quiesce(board, alpha, beta)
+        if ply > 0 and board.halfmove_clock >= 100:
+            return 0
+        key = chess.polyglot.zobrist_hash(board)
+        entry = self.table.get(key)
+        first = None
+        if entry is not None:
+            (stored, flag, score, first) = entry
+            if score > MATED:
+                score -= ply
+            elif score < -MATED:
+                score += ply
+            if ply > 0 and stored >= depth:
+                if flag == 0:
+                    return score
+                if flag < 0:
+                    beta = min(beta, score)
+                else:
+                    alpha = max(alpha, score)
+                if alpha >= beta:
+                    return score
+        moves = self.ordered(board, first, ply)
+        if not moves:
+            if check:
+                return -(MATE - ply)
+            return 0
+        start = alpha
+        best = -MATE * 2
+        best_move = None
+        for move in moves:
+            board.push(move)
+            score = -self.search(board, depth - 1, -beta, -alpha, ply + 1)
+            board.pop()
+            if score > best:
+                best = score
+                best_move = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                if not board.is_capture(move):
+                    killers = self.killers.setdefault(ply, [])
+                    if move not in killers:
+                        killers.insert(0, move)
+                        del killers[2:]
+                break
+        # flag: 0 exact, 1 lower bound, -1 upper bound
+        flag = 0
+        if best <= start:
+            flag = -1
+        elif best >= beta:
+            flag = 1
+        stored = best
+        if stored > MATED:
+            stored += ply
+        elif stored < -MATED:
+            stored -= ply
+        self.table[key] = (depth, flag, stored, best_move)
+        return best
+
+    def best_move(self, board, max_depth):
+        # iterative deepening, a search that runs out of time is thrown away and
+        # the last finished depth decides
+        best = None
+        key = chess.polyglot.zobrist_hash(board)
+        for depth in range(1, max_depth + 1):
+            try:
+                score = self.search(board, depth, -MATE * 2, MATE * 2, 0)
+            except Timeout:
+                break
+            self.can_stop = True
+            best = self.table.get(key, (0, 0, 0, best))[3]
+            if abs(score) > MATED:
+                break
+        return best
+
+
+def chess_move(fen, seconds=1.0, game=None, depth=64):
+    # returns the uci move for the side to move, or None when the game is over.
+    # game is any key for the game being played, searches for the same game
+    # share a transposition table
+    table = CHESS_TABLES.get(game)
+    REUSED["chess_table"] = table is not None and len(table) <= CHESS_TABLE_SIZE
+    if not REUSED["chess_table"]:
+        table = {}
+        CHESS_TABLES.set(game, table)
+    board = chess.Board(fen)
+    if board.is_game_over():
+        return None
+    search = ChessSearch(table, perf_counter() + seconds)
+    move = search.best_move(board, depth)
+    if move is None:
+        return None
+    return move.uci()
+
+
+# ultimate tic tac toe, searched with monte carlo tree search. a state is nine
+# 9 bit sub-boards per player, the engine's three masks of boards won by x, won
+# by o and tied, the board the next move has to be on (-1 when it's a free
+# choice) and whose turn it is. a move is (board, cell), numbered as in engines
+EMPTY_CELLS = [
+    [i for i in range(9) if not (mask >> i) & 1] for mask in range(FULL_BOARD + 1)
+]
+EXPLORATION = 1.4
+# search trees per game, kept between moves in the game's worker
+ULT_TREES = LRUCache(maxsize=32)
+
+
+class UltState:
+    __slots__ = ("marks", "meta", "forced", "turn", "winner")
+
+    def __init__(self, marks, meta, forced, turn, winner=None):
+        self.marks = marks
+        self.meta = meta
+        self.forced = forced
+        self.turn = turn
+        self.winner = winner
+
+    def copy(self):
+        return UltState(
+            [list(self.marks[0]), list(self.marks[1])],
+            list(self.meta),
+            self.forced,
+            self.turn,
+            self.winner,
+        )
+
+    def key(self):
+        return (
+            tuple(self.marks[0]),
+            tuple(self.marks[1]),
+            tuple(self.meta),
+            self.forced,
+            self.turn,
+        )
+
+    def boards(self):
+        if self.forced >= 0:
+            return (self.forced,)
+        return EMPTY_CELLS[self.meta[0] | self.meta[1] | self.meta[2]]
+
+    def moves(self):
+        return [
+            (n, c)
+            for n in self.boards()
+            for c in EMPTY_CELLS[self.marks[0][n] | self.marks[1][n]]
+        ]
+
+    def random_move(self, rng):
+        n = rng.choice(self.boards())
+        return (n, rng.choice(EMPTY_CELLS[self.marks[0][n] | self.marks[1][n]]))
+
+    def play(self, n, c):
+        # the same rules as engines.UltTicTacToe.make_move
+        player = self.turn
+        meta = self.meta
+        board = self.marks[player][n] | (1 << c)
+        self.marks[player][n] = board
+        if HAS_LINE[board]:
+            meta[player] |= 1 << n
+        elif board | self.marks[1 - player][n] == FULL_BOARD:
+            meta[2] |= 1 << n
+        decided = meta[0] | meta[1] | meta[2]
+        if (decided >> n) & 1:
+            for result in range(3):
+                if HAS_LINE[meta[result]]:
+                    self.winner = result
+                    break
+            else:
+                if decided == FULL_BOARD:
+                    self.winner = 2
+        if (decided >> c) & 1:
+            self.forced = -1
+        else:
+            self.forced = c
+        if self.winner is None:
+            self.turn = 1 - player
+
+
+class UltNode:
+    __slots__ = ("move", "parent", "player", "children", "untried", "visits", "wins")
+
+    def __init__(self, move, parent, player, untried):
+        self.move = move
+        self.parent = parent
+        # who made the move into this node, wins are counted for them
+        self.player = player
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0.0
+
+
+def ult_search(root, state, deadline, rng):
+    playouts = 0
+    # the clock is read every 64 playouts, and the first 64 always run
+    while playouts < 64 or playouts & 63 or perf_counter() < deadline:
+        node = root
+        current = state.copy()
+        # walk down the most promising children until one can grow
+        while not node.untried and node.children:
+            log_visits = EXPLORATION * log(node.visits)
+            best = None
+            best_score = -1.0
+            for child in node.children:
+                score = child.wins / child.visits + sqrt(log_visits / child.visits)
+                if score > best_score:
+                    best = child
+                    best_score = score
+            node = best
+            current.play(*node.move)
+        if node.untried and current.winner is None:
+            move = node.untried.pop(rng.randrange(len(node.untried)))
+            player = current.turn
+            current.play(*move)
+            untried = current.moves() if current.winner is None else []
+            child = UltNode(move, node, player, untried)
+            node.children.append(child)
+            node = child
+        while current.winner is None:
+            current.play(*current.random_move(rng))
+        while node is not None:
+            node.visits += 1
+            if current.winner == node.player:
+                node.wins += 1.0
+            elif current.winner == 2:
+                node.wins += 0.5
+            node = node.parent
+        playouts += 1
+    return playouts
+
+
+def ult_tic_tac_toe_move(bits, metabits, forced, turn, seconds=1.0, game=None):
+    # bits and metabits as in engines.UltTicTacToe, forced is the board the move
+    # has to be on or None. returns (board, cell) for the player whose turn it is
+    marks = [[(b >> (n * 9)) & FULL_BOARD for n in range(9)] for b in bits]
+    state = UltState(marks, list(metabits), -1 if forced is None else forced, turn)
+    root = None
+    kept = ULT_TREES.get(game)
+    if kept is not None:
+        # the tree from this game's last move, one reply down is where we are
+        (node, previous) = kept
+        key = state.key()
+        for child in node.children:
+            after = previous.copy()
+            after.play(*child.move)
+            if after.key() == key:
+                root = child
+                root.parent = None
+                break
+    REUSED["ult_tree"] = root is not None
+    if root is None:
+        root = UltNode(None, None, 1 - turn, state.moves())
+    ult_search(root, state, perf_counter() + seconds, Random())
+    best = max(root.children, key=lambda child: child.visits)
+    after = state.copy()
+    after.play(*best.move)
+    best.parent = None
+    ULT_TREES.set(game, (best, after))
+    return best.move
+
+
+def serve():
+    # a worker's loop: length prefixed pickles of (function, args) come in on
+    # stdin and (ok, result or error text, REUSED) go back on stdout, one at a
+    # time
+    requests = sys.stdin.buffer
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    # anything printed goes to stderr instead of into the replies
+    sys.stdout = sys.stderr
+    while True:
+        header = requests.read(4)
+        if len(header) < 4:
+            return
+        (func, args) = pickle.loads(requests.read(unpack(">I", header)[0]))
+        REUSED.clear()
+        try:
+            reply = (True, func(*args), REUSED)
+        except Exception as e:
+            reply = (False, f"{e!r}", REUSED)
+        data = pickle.dumps(reply)
+        replies.write(pack(">I", len(data)) + data)
+        replies.flush()
@@ -0,0 +1,282 @@
+from time import perf_counter
+from random import Random
+from codecs import encode as cencode
+from json import dumps as jdumps
+from zlib import compress as zcompress
+import argparse
+import os
+import tempfile
+import tracemalloc
+
+# microbenchmarks for the game classes, the state codec and the renderers.
+# run it before and after touching any of them:
+#
+#   python benchmark.py [--seconds 0.2] [--games 20] [--only Chess]
+#
+# main.py is imported with a throwaway config (in memory db, fake tokens) unless
+# QUIGGLE_CONFIG points somewhere else, bot.rest is swapped for a builder that
+# only records calls, and leaderboard writes are dropped.
+
+if "QUIGGLE_CONFIG" not in os.environ:
+    config = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    config.write(
+        jdumps(
+            {
+                "dburi": ":memory:",
+                "bottoken": "benchmark",
+                "debugbottoken": "benchmark",
+                "debugguilds": [],
+                "nerds": [],
+            }
+        )
+    )
+    config.close()
+    os.environ["QUIGGLE_CONFIG"] = config.name
+
+import main
+import engines
+from codec import encode, decode
+
+GAMES = ["TicTacToe", "UltTicTacToe", "ConnectFour", "Battleship", "Chess"]
+PLAYERS = [1000000000000000001, 1000000000000000002]
+GUILD = 1000000000000000003
+
+
+class Builder:
+    # stands in for hikari's action row, button, select menu and option builders
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.children = []
+
+    def add_button(self, *args):
+        return Builder(self)
+
+    def add_select_menu(self, *args):
+        return Builder(self)
+
+    def add_option(self, *args):
+        return Builder(self)
+
+    def add_to_container(self):
+        self.parent.children.append(self)
+        return self.parent
+
+    add_to_menu = add_to_container
+
+    def __getattr__(self, name):
+        if name.startswith("set_"):
+            return lambda *args: self
+        raise AttributeError(name)
+
+
+class Rest:
+    def build_action_row(self):
+        return Builder()
+
+
+class Bot:
+    rest = Rest()
+
+    def get_me(self):
+        return None
+
+
+main.bot = Bot()
+main.increment_leaderboard_value = lambda user, game: None
+
+
+def load(data, user):
+    data = decode(encode(data))
+    if data["type"] == "Battleship":
+        return main.Battleship.load_data(data, user)
+    return main.getClass(data["type"]).load_data(data)
+
+
+def clicks(game):
+    # (user, custom id or select value) for every click the game would accept
+    # right now, in the order a player would send them
+    name = type(game).__name__
+    if name == "Chess":
+        user = game.players[game.turn]
+        moves = game.get_moves()
+        if game.move is None or game.move not in moves:
+            return [(user, move) for move in moves]
+        return [(user, move) for move in moves[game.move][1]]
+    if name == "Battleship":
+        return None
+    if name == "ConnectFour":
+        return [(game.players[game.turn], str(move)) for move in game.get_moves()]
+    return [(game.players[game.turn], move) for move in game.get_moves()]
+
+
+def battleship_clicks(data, rng):
+    # setup: either player picks a spot and a direction, attack: the player
+    # whose turn it is picks a letter then a number
+    if data["setup"]:
+        player = rng.randint(0, 1)
+        if all(type(ship) != type(0) for ship in data["pieces"][player]):
+            player = (player + 1) % 2
+        axis = rng.choice(["x", "y", "d"])
+        if axis == "d":
+            return [(PLAYERS[player], f"d|{rng.randint(0, 3)}")]
+        return [(PLAYERS[player], f"{axis}|{rng.randint(0, 9)}")]
+    selected = data["selected"][data["turn"]]
+    axis = "y" if "x" in selected else "x"
+    return [(PLAYERS[data["turn"]], f"{axis}|{rng.randint(0, 9)}")]
+
+
+def play(name, rng):
+    # random playout, returns every (state, user, move) along the way where
+    # move is the click that was made from that state
+    data = main.getClass(name)(list(PLAYERS), GUILD).get_data()
+    history = []
+    for _ in range(5000):
+        if data["type"] == "Battleship":
+            options = battleship_clicks(data, rng)
+            game = load(data, options[0][0])
+        else:
+            game = load(data, None)
+            options = clicks(game)
+        if not options:
+            break
+        (user, move) = rng.choice(options)
+        history.append((data, user, move))
+        game.make_move(move)
+        data = game.get_data()
+        if game.winner is not None:
+            break
+    return history
+
+
+def build_corpus(games, count, seed):
+    # a few mid game and end game states per game, taken from random playouts
+    rng = Random(seed)
+    corpus = {}
+    for name in games:
+        corpus[name] = {"mid": [], "end": []}
+        for _ in range(count):
+            history = play(name, rng)
+            if not history:
+                continue
+            corpus[name]["mid"].append(history[len(history) // 2])
+            corpus[name]["end"].append(history[-1])
+    return corpus
+
+
+def clear_caches():
+    main.renders.clear()
+    main.component_templates.clear()
+    engines.chess_moves.clear()
+    main.live_games.clear()
+
+
+def fresh_games(states):
+    return [load(data, user) for (data, user, _, _) in states]
+
+
+def measure(op, states, seconds, fresh=False, cold=False):
+    # returns (ops per second, peak bytes allocated per op)
+    games = fresh_games(states)
+    runs = 0
+    elapsed = 0.0
+    while elapsed < seconds:
+        if fresh:
+            games = fresh_games(states)
+        if cold:
+            clear_caches()
+        start = perf_counter()
+        for (game, state) in zip(games, states):
+            op(game, state)
+        elapsed += perf_counter() - start
+        runs += len(states)
+    peaks = []
+    games = fresh_games(states)
+    for (game, state) in zip(games, states):
+        if cold:
+            clear_caches()
+        tracemalloc.start()
+        op(game, state)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return runs / elapsed, sum(peaks) / len(peaks)
+
+
+def checkwin(game, state):
+    if isinstance(game, main.ConnectFour):
+        # the last piece dropped is the top of any column, checking the first
+        # non empty one is as expensive as any other
+        for (column, height) in enumerate(game.heights):
+            if height:
+                return game.checkwin(column, height - 1)
+        return
+    if isinstance(game, main.UltTicTacToe) and game.currentboard[0] is None:
+        return game.metacheckwin()
+    return game.checkwin()
+
+
+OPS = [
+    ("make_move", lambda game, state: game.make_move(state[2]), True, False),
+    ("checkwin", checkwin, True, False),
+    ("build_message", lambda game, state: game.build_message(), False, False),
+    ("build_message cold", lambda game, state: game.build_message(), False, True),
+    ("build_components", lambda game, state: game.build_components(), False, False),
+    (
+        "build_components cold",
+        lambda game, state: game.build_components(),
+        False,
+        True,
+    ),
+    ("encode", lambda game, state: encode(state[0]), False, False),
+    ("decode", lambda game, state: decode(state[3]), False, False),
+]
+
+
+def legacy_size(data):
+    return len(cencode(zcompress(bytes(jdumps(data), "utf-8")), "hex"))
+
+
+def report(corpus, seconds, ops):
+    print(f"{'game':<14}{'stage':<6}{'op':<24}{'ops/sec':>12}{'peak KiB/op':>13}")
+    for (name, stages) in corpus.items():
+        for (stage, states) in stages.items():
+            if not states:
+                continue
+            states = [(d, user, move, encode(d)) for (d, user, move) in states]
+            for (op, func, fresh, cold) in OPS:
+                if ops and op.split()[0] not in ops:
+                    continue
+                (rate, peak) = measure(func, states, seconds, fresh, cold)
+                print(
+                    f"{name:<14}{stage:<6}{op:<24}{rate:>12,.0f}{peak / 1024:>13.1f}"
+                )
+    print()
+    print(
+        f"{'game':<14}{'stage':<6}{'state avg':>10}{'max':>6}"
+        f"{'legacy avg':>12}{'message max':>13}"
+    )
+    for (name, stages) in corpus.items():
+        for (stage, states) in stages.items():
+            if not states:
+                continue
+            sizes = [len(encode(data)) for (data, _, _) in states]
+            legacy = [legacy_size(data) for (data, _, _) in states]
+            texts = [
+                len(load(data, user).build_message()["text"])
+                for (data, user, _) in states
+            ]
+            print(
+                f"{name:<14}{stage:<6}{sum(sizes) / len(sizes):>10.0f}{max(sizes):>6}"
+                f"{sum(legacy) / len(legacy):>12.0f}{max(texts):>8}/2000"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=0.2, help="time per op")
+    parser.add_argument("--games", type=int, default=20, help="playouts per game")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", choices=GAMES, help="games to run")
+    parser.add_argument("--ops", nargs="*", help="ops to run, e.g. encode decode")
+    args = parser.parse_args()
+    corpus = build_corpus(args.only or GAMES, args.games, args.seed)
+    report(corpus, args.seconds, args.ops)
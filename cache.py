@@ -0,0 +1,45 @@
+from collections import OrderedDict
+from time import monotonic
+
+
+class LRUCache:
+    # bounded dict that forgets the least recently used entry once full, and
+    # optionally anything older than ttl seconds
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self.data.get(key)
+        if entry is None:
+            return default
+        if entry[1] is not None and entry[1] < monotonic():
+            del self.data[key]
+            return default
+        self.data.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, value):
+        expires = None
+        if self.ttl is not None:
+            expires = monotonic() + self.ttl
+        self.data[key] = (value, expires)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self.data.pop(key, None)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def clear(self):
+        self.data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        return len(self.data)
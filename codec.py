@@ -0,0 +1,312 @@
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from codecs import decode as cdecode
+from json import dumps as jdumps, loads as jloads
+from struct import pack, unpack_from
+from zlib import compress as zcompress, decompress as zdecompress
+
+# game state is packed per game type into a few bytes, prefixed with a version
+# byte and a type tag, and written out as unpadded urlsafe base64. the old
+# format (zlib'd json as lowercase hex) is still accepted by decode, and any
+# data without a packer falls back to zlib'd json inside the new envelope.
+
+VERSION = 1
+
+GENERIC = 0
+TAGS = {
+    "Invite": 1,
+    "TicTacToe": 2,
+    "UltTicTacToe": 3,
+    "ConnectFour": 4,
+    "Battleship": 5,
+    "Chess": 6,
+}
+GAMES = {v: k for (k, v) in TAGS.items()}
+
+# cell values for the tic tac toe boards, board winners can also be 2 (tie)
+MARKS = [None, 0, 1, 2]
+# battleship attack boards: untouched, miss, hit, and the old "filled" overlay
+SHOTS = [None, False, True, "filled"]
+SHIP_DIRECTIONS = [[-1, 0], [1, 0], [0, -1], [0, 1]]
+NONE = 0xFF
+
+
+def pack_cells(values, table, bits):
+    number = 0
+    for (i, value) in enumerate(values):
+        number |= table.index(value) << (i * bits)
+    return number.to_bytes((len(values) * bits + 7) // 8, "little")
+
+
+def unpack_cells(data, offset, count, table, bits):
+    size = (count * bits + 7) // 8
+    number = int.from_bytes(data[offset : offset + size], "little")
+    mask = (1 << bits) - 1
+    values = [table[(number >> (i * bits)) & mask] for i in range(count)]
+    return values, offset + size
+
+
+def flatten(board):
+    if isinstance(board, list):
+        return [cell for row in board for cell in flatten(row)]
+    return [board]
+
+
+def nest(cells, shape):
+    if len(shape) == 1:
+        return list(cells)
+    step = len(cells) // shape[0]
+    return [
+        nest(cells[i * step : (i + 1) * step], shape[1:]) for i in range(shape[0])
+    ]
+
+
+def pack_optional(value):
+    if value is None:
+        return NONE
+    return value
+
+
+def unpack_optional(value):
+    if value == NONE:
+        return None
+    return value
+
+
+def pack_common(data):
+    out = bytearray(pack(">B", len(data["players"])))
+    for player in data["players"]:
+        out += pack(">Q", player)
+    out += pack(">Q", data["guild_id"] or 0)
+    return out
+
+
+def unpack_common(data, offset):
+    (count,) = unpack_from(">B", data, offset)
+    players = list(unpack_from(f">{count}Q", data, offset + 1))
+    offset += 1 + count * 8
+    (guild_id,) = unpack_from(">Q", data, offset)
+    return {"players": players, "guild_id": guild_id or None}, offset + 8
+
+
+def pack_invite(data):
+    return pack(">B", TAGS[data["game"]])
+
+
+def unpack_invite(data, offset):
+    return {"game": GAMES[data[offset]]}
+
+
+def pack_tictactoe(data):
+    return pack(">B", data["turn"]) + pack_cells(flatten(data["board"]), MARKS, 2)
+
+
+def unpack_tictactoe(data, offset):
+    cells, _ = unpack_cells(data, offset + 1, 9, MARKS, 2)
+    return {"turn": data[offset], "board": nest(cells, [3, 3])}
+
+
+def pack_ulttictactoe(data):
+    current = NONE
+    if data["currentboard"][0] is not None:
+        current = data["currentboard"][0] * 3 + data["currentboard"][1]
+    return (
+        pack(">BB", data["turn"], current)
+        + pack_cells(flatten(data["board"]), MARKS, 2)
+        + pack_cells(flatten(data["boardwinners"]), MARKS, 2)
+    )
+
+
+def unpack_ulttictactoe(data, offset):
+    (turn, current) = unpack_from(">BB", data, offset)
+    cells, offset = unpack_cells(data, offset + 2, 81, MARKS, 2)
+    winners, offset = unpack_cells(data, offset, 9, MARKS, 2)
+    currentboard = [None, None]
+    if current != NONE:
+        currentboard = [current // 3, current % 3]
+    return {
+        "turn": turn,
+        "board": nest(cells, [3, 3, 3, 3]),
+        "boardwinners": nest(winners, [3, 3]),
+        "currentboard": currentboard,
+    }
+
+
+def pack_connectfour(data):
+    board = data["board"]
+    heights = []
+    pieces = []
+    for column in board:
+        height = column.index(None) if None in column else len(column)
+        if any(cell is not None for cell in column[height:]):
+            raise ValueError("floating connect four piece")
+        heights.append(height)
+        pieces += column[:height]
+    return (
+        pack(">BBB", data["turn"], len(board), len(board[0]))
+        + bytes(heights)
+        + pack_cells(pieces, [0, 1], 1)
+    )
+
+
+def unpack_connectfour(data, offset):
+    (turn, width, height) = unpack_from(">BBB", data, offset)
+    offset += 3
+    heights = data[offset : offset + width]
+    pieces, offset = unpack_cells(data, offset + width, sum(heights), [0, 1], 1)
+    board = []
+    for column in heights:
+        board.append(pieces[:column] + [None] * (height - column))
+        pieces = pieces[column:]
+    return {"turn": turn, "board": board}
+
+
+def pack_ship(ship):
+    if isinstance(ship, int):
+        return pack(">B", ship)
+    direction = 0
+    if len(ship) > 1:
+        direction = SHIP_DIRECTIONS.index(
+            [ship[1][0] - ship[0][0], ship[1][1] - ship[0][1]]
+        )
+    if ship != unpack_ship(ship[0][0], ship[0][1], direction, len(ship)):
+        raise ValueError("battleship ship is not a straight line")
+    return pack(">BBB", 0x80 | len(ship), ship[0][0] << 4 | ship[0][1], direction)
+
+
+def unpack_ship(x, y, direction, length):
+    (dx, dy) = SHIP_DIRECTIONS[direction]
+    return [[x + dx * i, y + dy * i] for i in range(length)]
+
+
+def pack_battleship(data):
+    out = bytearray(
+        pack(
+            ">BBB",
+            pack_optional(data["turn"]),
+            data["setup"],
+            pack_optional(data["winner"]),
+        )
+    )
+    out += pack_cells(flatten(data["board"]), SHOTS, 2)
+    for (pieces, selected) in zip(data["pieces"], data["selected"]):
+        if set(selected.keys()) - {"x", "y"}:
+            raise ValueError("unexpected battleship selection")
+        out += pack(">B", len(pieces))
+        for ship in pieces:
+            out += pack_ship(ship)
+        x = selected.get("x", None)
+        y = selected.get("y", None)
+        x = 0 if x is None else int(x) + 1
+        y = 0 if y is None else int(y) + 1
+        out += pack(">B", x << 4 | y)
+    return bytes(out)
+
+
+def unpack_battleship(data, offset):
+    (turn, setup, winner) = unpack_from(">BBB", data, offset)
+    cells, offset = unpack_cells(data, offset + 3, 200, SHOTS, 2)
+    setup = bool(setup)
+    pieces = []
+    selected = []
+    for _ in range(2):
+        count = data[offset]
+        offset += 1
+        ships = []
+        for _ in range(count):
+            if data[offset] & 0x80:
+                (length, start, direction) = unpack_from(">BBB", data, offset)
+                ship = unpack_ship(start >> 4, start & 15, direction, length & 0x7F)
+                ships.append(ship)
+                offset += 3
+            else:
+                ships.append(data[offset])
+                offset += 1
+        pieces.append(ships)
+        choice = {}
+        for (key, value) in (("x", data[offset] >> 4), ("y", data[offset] & 15)):
+            if value:
+                # setup keeps the raw custom id piece, attacks keep an index
+                choice[key] = str(value - 1) if setup else value - 1
+        selected.append(choice)
+        offset += 1
+    return {
+        "turn": unpack_optional(turn),
+        "board": nest(cells, [2, 10, 10]),
+        "setup": setup,
+        "pieces": pieces,
+        "selected": selected,
+        "winner": unpack_optional(winner),
+    }
+
+
+def pack_chess(data):
+    move = NONE
+    if data["move"] is not None:
+        move = (ord(data["move"][0]) - ord("a")) + (int(data["move"][1]) - 1) * 8
+    return pack(">B", move) + data["board"].encode("ascii")
+
+
+def unpack_chess(data, offset):
+    move = None
+    if data[offset] != NONE:
+        move = f"{chr(ord('a') + data[offset] % 8)}{data[offset] // 8 + 1}"
+    return {"board": data[offset + 1 :].decode("ascii"), "move": move}
+
+
+PACKERS = {
+    "Invite": (pack_invite, unpack_invite),
+    "TicTacToe": (pack_tictactoe, unpack_tictactoe),
+    "UltTicTacToe": (pack_ulttictactoe, unpack_ulttictactoe),
+    "ConnectFour": (pack_connectfour, unpack_connectfour),
+    "Battleship": (pack_battleship, unpack_battleship),
+    "Chess": (pack_chess, unpack_chess),
+}
+
+
+def to_text(data: bytes):
+    return urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def from_text(string: str):
+    return urlsafe_b64decode(string + "=" * (-len(string) % 4))
+
+
+def encode(data: dict):
+    game = data.get("type") if isinstance(data, dict) else None
+    if game in PACKERS:
+        try:
+            body = pack_common(data) + PACKERS[game][0](data)
+            return to_text(pack(">BB", VERSION, TAGS[game]) + body)
+        except (KeyError, IndexError, TypeError, ValueError, OverflowError):
+            pass
+    body = zcompress(bytes(jdumps(data), "utf-8"))
+    return to_text(pack(">BB", VERSION, GENERIC) + body)
+
+
+def decode(string: str):
+    if string[:1] in "0123456789abcdef":
+        return legacy_decode(string)
+    data = from_text(string)
+    (version, tag) = unpack_from(">BB", data)
+    if version != VERSION:
+        raise ValueError(f"unknown state version {version}")
+    if tag == GENERIC:
+        return jloads(zdecompress(data[2:]).decode("utf-8"))
+    game = GAMES[tag]
+    state, offset = unpack_common(data, 2)
+    state.update(PACKERS[game][1](data, offset))
+    state["type"] = game
+    return state
+
+
+def game_type(string: str):
+    # the type of a packed state, read from the header without unpacking it
+    if string[:1] not in "0123456789abcdef":
+        (version, tag) = unpack_from(">BB", from_text(string[:4]))
+        if version == VERSION and tag != GENERIC:
+            return GAMES[tag]
+    return decode(string)["type"]
+
+
+def legacy_decode(string: str):
+    return jloads(zdecompress(cdecode(string, "hex")).decode("utf-8"))
@@ -0,0 +1,651 @@
+from random import randint
+import chess
+from cache import LRUCache
+
+# the rules of every game with no discord in them: state, legal moves, making a
+# move and the result. main.py subclasses these to draw them and take clicks,
+# anything else (simulations, worker processes) can use them as they are
+
+
+# tic tac toe boards are a pair of 9 bit masks, one per player, with cell
+# y * 3 + x in bit y * 3 + x. ultimate tic tac toe uses 81 bits per player,
+# sub-board n (numbered the same way as cells) in bits n * 9 to n * 9 + 8
+WIN_MASKS = (
+    0b000000111,
+    0b000111000,
+    0b111000000,
+    0b001001001,
+    0b010010010,
+    0b100100100,
+    0b100010001,
+    0b001010100,
+)
+FULL_BOARD = 0b111111111
+# HAS_LINE[bits] is True when the 9 bit mask contains any of the winning lines
+HAS_LINE = [any((b & m) == m for m in WIN_MASKS) for b in range(FULL_BOARD + 1)]
+CELL_MOVES = [f"{i % 3}|{i // 3}" for i in range(9)]
+MOVE_CELLS = {move: i for (i, move) in enumerate(CELL_MOVES)}
+
+
+def cells_to_bits(cells, marks):
+    bits = [0] * marks
+    for (i, cell) in enumerate(cells):
+        if cell is not None:
+            bits[cell] |= 1 << i
+    return bits
+
+
+def mark_at(bits, i):
+    for (mark, b) in enumerate(bits):
+        if (b >> i) & 1:
+            return mark
+    return None
+
+
+class TicTacToe:
+    def __init__(
+        self,
+        players,
+        guild_id,
+        turn=None,
+        board=None,
+    ):
+        if turn is None:
+            turn = randint(0, 1)
+        self.players = players
+        self.guild_id = guild_id
+        self.turn = turn
+        self.bits = [0, 0]
+        if board is not None:
+            self.bits = cells_to_bits([c for row in board for c in row], 2)
+        self.winner = None
+
+    @property
+    def board(self):
+        return [[mark_at(self.bits, y * 3 + x) for x in range(3)] for y in range(3)]
+
+    def get_moves(self):
+        taken = self.bits[0] | self.bits[1]
+        return [CELL_MOVES[i] for i in range(9) if not (taken >> i) & 1]
+
+    def make_move(self, move):
+        cell = MOVE_CELLS.get(move)
+        if cell is not None and not ((self.bits[0] | self.bits[1]) >> cell) & 1:
+            if self.winner is None:
+                self.bits[self.turn] |= 1 << cell
+                self.checkwin()
+                if self.winner is None:
+                    self.turn = (self.turn + 1) % 2
+                    return True
+
+        return False
+
+    def get_data(self):
+        return {
+            "players": self.players,
+            "turn": self.turn,
+            "board": self.board,
+            "type": "TicTacToe",
+            "guild_id": self.guild_id,
+        }
+
+    def checkwin(self):
+        for player in range(2):
+            if HAS_LINE[self.bits[player]]:
+                self.winner = player
+                return
+        if (self.bits[0] | self.bits[1]) == FULL_BOARD:
+            self.winner = 2
+
+    @classmethod
+    def load_data(cls, data):
+        return cls(data["players"], data["guild_id"], data["turn"], data["board"])
+
+
+class UltTicTacToe:
+    def __init__(
+        self,
+        players,
+        guild_id,
+        turn=None,
+        board=None,
+        boardwinners=None,
+        currentboard=None,
+    ):
+        if turn is None:
+            turn = randint(0, 1)
+        if currentboard is None:
+            currentboard = [None, None]
+        self.players = players
+        self.guild_id = guild_id
+        self.turn = turn
+        # stored boards are indexed board[column][row][y][x] for the sub-board
+        # at boardwinners[row][column]
+        self.bits = [0, 0]
+        if board is not None:
+            cells = []
+            for n in range(9):
+                for row in board[n % 3][n // 3]:
+                    cells += row
+            self.bits = cells_to_bits(cells, 2)
+        # sub-boards won by x, by o, and tied
+        self.metabits = [0, 0, 0]
+        if boardwinners is not None:
+            self.metabits = cells_to_bits([c for row in boardwinners for c in row], 3)
+        self.winner = None
+        self.currentboard = currentboard
+
+    @property
+    def board(self):
+        return [
+            [
+                [
+                    [mark_at(self.bits, (r * 3 + c) * 9 + y * 3 + x) for x in range(3)]
+                    for y in range(3)
+                ]
+                for r in range(3)
+            ]
+            for c in range(3)
+        ]
+
+    @property
+    def boardwinners(self):
+        return [[mark_at(self.metabits, r * 3 + c) for c in range(3)] for r in range(3)]
+
+    def get_data(self):
+        return {
+            "players": self.players,
+            "turn": self.turn,
+            "board": self.board,
+            "type": "UltTicTacToe",
+            "boardwinners": self.boardwinners,
+            "currentboard": self.currentboard,
+            "guild_id": self.guild_id,
+        }
+
+    @classmethod
+    def load_data(cls, data):
+        return cls(
+            data["players"],
+            data["guild_id"],
+            data["turn"],
+            data["board"],
+            data["boardwinners"],
+            data["currentboard"],
+        )
+
+    def current(self):
+        return self.currentboard[0] * 3 + self.currentboard[1]
+
+    def sub_board(self, n, player):
+        return (self.bits[player] >> (n * 9)) & FULL_BOARD
+
+    def get_moves(self, meta=False):
+        if self.currentboard[0] is not None and not meta:
+            n = self.current()
+            taken = self.sub_board(n, 0) | self.sub_board(n, 1)
+        else:
+            taken = self.metabits[0] | self.metabits[1] | self.metabits[2]
+        return [CELL_MOVES[i] for i in range(9) if not (taken >> i) & 1]
+
+    def make_move(self, move):
+        if self.winner is None:
+            meta = False
+            if self.currentboard[0] is None:
+                meta = True
+            cell = MOVE_CELLS.get(move)
+            if cell is not None and move in self.get_moves():
+                if not meta:
+                    self.bits[self.turn] |= 1 << (self.current() * 9 + cell)
+                    self.checkwin()
+                self.metacheckwin()
+                decided = self.metabits[0] | self.metabits[1] | self.metabits[2]
+                if not (decided >> cell) & 1:
+                    self.currentboard = [cell // 3, cell % 3]
+                else:
+                    self.currentboard = [None, None]
+                if self.winner is None and not meta:
+                    self.turn = (self.turn + 1) % 2
+                    return True
+        return False
+
+    def checkwin(self):
+        n = self.current()
+        for player in range(2):
+            if HAS_LINE[self.sub_board(n, player)]:
+                self.metabits[player] |= 1 << n
+                return
+        if (self.sub_board(n, 0) | self.sub_board(n, 1)) == FULL_BOARD:
+            self.metabits[2] |= 1 << n
+
+    def metacheckwin(self):
+        # three tied boards in a row is a tied game, like any other full board
+        for result in range(3):
+            if HAS_LINE[self.metabits[result]]:
+                self.winner = result
+                return
+        if (self.metabits[0] | self.metabits[1] | self.metabits[2]) == FULL_BOARD:
+            self.winner = 2
+
+
+class ConnectFour:
+    def __init__(
+        self,
+        players,
+        guild_id,
+        turn=None,
+        board=None,
+        width=7,
+        height=6,
+    ):
+        if turn is None:
+            turn = randint(0, 1)
+        if board is None:
+            board = [[None for _ in range(height)] for _ in range(width)]
+        self.players = players
+        self.guild_id = guild_id
+        self.turn = turn
+        # board[column][row], row 0 is the bottom of the column
+        self.board = board
+        self.width = len(board)
+        self.height = len(board[0])
+        self.heights = []
+        for column in board:
+            if None in column:
+                self.heights.append(column.index(None))
+            else:
+                self.heights.append(len(column))
+        self.played = sum(self.heights)
+        self.winner = None
+        self.winningpieces = [
+            [False for _ in range(self.height)] for _ in range(self.width)
+        ]
+
+    def get_moves(self):
+        moves = []
+        for (i, height) in enumerate(self.heights):
+            if height < self.height:
+                moves.append(i)
+        return moves
+
+    def make_move(self, move):
+        if self.winner is None:
+            move = int(move)
+            if 0 <= move < self.width and self.heights[move] < self.height:
+                row = self.heights[move]
+                self.board[move][row] = self.turn
+                self.heights[move] += 1
+                self.played += 1
+                self.checkwin(move, row)
+                if self.winner is None:
+                    self.turn = (self.turn + 1) % 2
+                    return True
+        return False
+
+    def get_data(self):
+        return {
+            "players": self.players,
+            "turn": self.turn,
+            "board": self.board,
+            "type": "ConnectFour",
+            "guild_id": self.guild_id,
+        }
+
+    def checkwin(self, column, row):
+        # only lines through the piece that was just dropped can be new, and
+        # only the 3 pieces either side of it on each line matter
+        player = self.board[column][row]
+        for (dx, dy) in ((1, 0), (0, 1), (1, 1), (1, -1)):
+            line = [(column, row)]
+            for sign in (1, -1):
+                x = column + dx * sign
+                y = row + dy * sign
+                for _ in range(3):
+                    if not (0 <= x < self.width and 0 <= y < self.height):
+                        break
+                    if self.board[x][y] != player:
+                        break
+                    line.append((x, y))
+                    x += dx * sign
+                    y += dy * sign
+            if len(line) >= 4:
+                for (x, y) in line:
+                    self.winningpieces[x][y] = True
+                self.winner = player
+        if self.winner is None and self.played == self.width * self.height:
+            self.winner = 2
+
+    @classmethod
+    def load_data(cls, data):
+        return cls(data["players"], data["guild_id"], data["turn"], data["board"])
+
+
+class Battleship:
+    def __init__(
+        self,
+        players,
+        guild_id,
+        turn=None,
+        board=None,
+        setup=True,
+        pieces=None,
+        selected=None,
+        player=None,
+        winner=None,
+    ):
+        if board is None:
+            board = [
+                [[None for _ in range(10)] for _ in range(10)],
+                [[None for _ in range(10)] for _ in range(10)],
+            ]
+        if pieces is None:
+            pieces = [[5, 4, 3, 3, 2] for _ in range(2)]
+            # pieces = [[2] for _ in range(2)]
+        if selected is None:
+            selected = [{}, {}]
+        self.players = players
+        self.guild_id = guild_id
+        self.turn = turn
+        self.board = board
+        self.winner = winner
+        self.setup = setup
+        self.pieces = pieces
+        self.selected = selected
+        self.dirmap = [[-1, 0], [1, 0], [0, -1], [0, 1]]
+        self.index_ships()
+        self.set_player(player)
+
+    def index_ships(self):
+        # (x, y) -> ship number for each player's placed ships, plus how many
+        # hits each ship and each attacker has taken so far
+        self.shipindex = [{}, {}]
+        self.shiphits = [[0 for _ in ships] for ships in self.pieces]
+        self.hitcount = [0, 0]
+        for (player, ships) in enumerate(self.pieces):
+            for (n, ship) in enumerate(ships):
+                if not type(ship) == type(0):
+                    for (x, y) in ship:
+                        self.shipindex[player][(x, y)] = n
+        for (attacker, seamap) in enumerate(self.board):
+            defender = (attacker + 1) % 2
+            for (x, column) in enumerate(seamap):
+                for (y, cell) in enumerate(column):
+                    if cell == "filled":
+                        # old render overlay that leaked into saved boards
+                        column[y] = None
+                    elif cell is True:
+                        self.hitcount[attacker] += 1
+                        n = self.shipindex[defender].get((x, y))
+                        if n is not None:
+                            self.shiphits[defender][n] += 1
+
+    def set_player(self, player):
+        # everything here depends on who clicked, not on the stored game
+        self.player = player
+        self.piece = None
+        self.meta = None
+        self.piecesleft = []
+        if self.player is not None:
+            for (i, j) in enumerate(self.pieces[self.player]):
+                if type(j) == type(0):
+                    if self.piece is None:
+                        self.piece = i
+                    self.piecesleft.append(j)
+        # what the last shot did, for the message
+        self.shot = None
+        self.sunk = None
+
+    def get_moves(self):
+        moves = []
+        if self.setup:
+            for i in range(10):
+                moves.append(f"y|{i}")
+            for i in range(10):
+                moves.append(f"x|{i}")
+            moves.append("d|0")
+            moves.append("d|1")
+            moves.append("d|2")
+            moves.append("d|3")
+        else:
+            for i in range(10):
+                moves.append(f"y|{i}")
+            for i in range(10):
+                moves.append(f"x|{i}")
+
+        return moves
+
+    def make_move(self, move):
+        if self.winner is None:
+            ping = False
+            if move in self.get_moves():
+                if self.setup:
+                    movep = move.split("|")
+                    if self.piece is None:
+                        self.meta = "noneleft"
+                        return
+                    if (
+                        self.selected[self.player].get("x", None) is None
+                        or self.selected[self.player].get("y", None) is None
+                    ) and movep[0] == "d":
+                        self.meta = "direction"
+                        return
+                    if movep[0] == "d":
+                        shiplength = self.pieces[self.player][self.piece]
+                        direction = self.dirmap[int(movep[1])]
+                        x = int(self.selected[self.player]["x"])
+                        y = int(self.selected[self.player]["y"])
+                        ship = [
+                            [x + (direction[0] * i), y + (direction[1] * i)]
+                            for i in range(shiplength)
+                        ]
+                        for (i, j) in ship:
+                            if (
+                                not (0 <= i <= 9 and 0 <= j <= 9)
+                                or (i, j) in self.shipindex[self.player]
+                            ):
+                                self.meta = "offmap"
+                                return
+                        self.pieces[self.player][self.piece] = ship
+                        for (i, j) in ship:
+                            self.shipindex[self.player][(i, j)] = self.piece
+                        self.selected[self.player] = {}
+                    else:
+                        self.selected[self.player][movep[0]] = movep[1]
+                else:
+                    movep = move.split("|")
+                    if self.player != self.turn:
+                        self.meta = "noturturn"
+                        return
+
+                    if (
+                        movep[0] == "x"
+                        and self.selected[self.turn].get("y", None) is not None
+                    ):
+                        if (
+                            self.board[self.turn][int(movep[1])][
+                                self.selected[self.turn]["y"]
+                            ]
+                            is not None
+                        ):
+                            self.meta = "alreadyhit"
+                            return
+                    if (
+                        movep[0] == "y"
+                        and self.selected[self.turn].get("x", None) is not None
+                    ):
+                        if (
+                            self.board[self.turn][self.selected[self.turn]["x"]][
+                                int(movep[1])
+                            ]
+                            is not None
+                        ):
+                            self.meta = "alreadyhit"
+                            return
+
+                    self.selected[self.turn][movep[0]] = int(movep[1])
+
+                    x = self.selected[self.turn].get("x", None)
+                    y = self.selected[self.turn].get("y", None)
+
+                    if x is not None and y is not None:
+                        defender = (self.turn + 1) % 2
+                        ship = self.shipindex[defender].get((x, y))
+                        hit = ship is not None
+                        self.board[self.turn][x][y] = hit
+                        self.shot = hit
+                        if hit:
+                            self.hitcount[self.turn] += 1
+                            self.shiphits[defender][ship] += 1
+                            if self.shiphits[defender][ship] == len(
+                                self.pieces[defender][ship]
+                            ):
+                                self.sunk = ship
+                        self.selected[self.turn] = {}
+                    else:
+                        self.meta = "updateboard"
+                        return
+                self.checkwin()
+                if self.winner is None and not self.setup:
+                    self.turn = (self.turn + 1) % 2
+                    ping = True
+            return ping
+
+    def get_data(self):
+        data = {
+            "players": self.players,
+            "turn": self.turn,
+            "board": self.board,
+            "setup": self.setup,
+            "type": "Battleship",
+            "guild_id": self.guild_id,
+            "pieces": self.pieces,
+            "selected": self.selected,
+            "winner": self.winner,
+        }
+        return data
+
+    def checkwin(self):
+        if self.setup:
+            totalleft = 0
+            for i in self.pieces[0]:
+                if type(i) == type(1):
+                    totalleft += 1
+            for i in self.pieces[1]:
+                if type(i) == type(1):
+                    totalleft += 1
+            if totalleft == 0:
+                self.setup = False
+                self.turn = randint(0, 1)
+        else:
+            if self.hitcount[self.turn] == len(self.shipindex[(self.turn + 1) % 2]):
+                self.winner = self.turn
+
+    @staticmethod
+    def ship_name(n):
+        names = ["carrier", "battleship", "cruiser", "submarine", "destroyer"]
+        if n < len(names):
+            return names[n]
+        return "ship"
+
+    @staticmethod
+    def player_index(players, user):
+        for (i, j) in enumerate(players):
+            if user == j:
+                return i
+        return None
+
+    @classmethod
+    def load_data(cls, data, player=None):
+        if player is not None:
+            player = cls.player_index(data["players"], player)
+        return cls(
+            data["players"],
+            data["guild_id"],
+            data["turn"],
+            data["board"],
+            data["setup"],
+            data["pieces"],
+            data["selected"],
+            player,
+            data["winner"],
+        )
+
+
+# legal moves for every position seen recently, see Chess.get_moves
+chess_moves = LRUCache(maxsize=1024)
+
+
+class Chess:
+    def __init__(self, players, guild_id, board=None, move=None):
+        self.guild_id = guild_id
+        if board is None:
+            self.chess = chess.Board()
+            if randint(0, 1) == 0:
+                self.players = [players[1], players[0]]
+            else:
+                self.players = players
+        else:
+            self.chess = chess.Board(board)
+            self.players = players
+        self.winner = None
+        self.playermap = {chess.WHITE: 0, chess.BLACK: 1}
+        self.turn = self.playermap[self.chess.turn]
+        self.move = move
+        self.names = ["", "Pawn", "Knight", "Bishop", "Rook", "Queen", "King"]
+
+    def get_moves(self):
+        # origin square -> (piece name, {move: description}), built once per
+        # position and shared by every game sitting on the same fen
+        fen = self.chess.fen()
+        moves = chess_moves.get(fen)
+        if moves is None:
+            moves = {}
+            for move in self.chess.legal_moves:
+                movestr = move.uci()
+                if movestr[:2] not in moves:
+                    piece = self.chess.piece_type_at(move.from_square)
+                    moves[movestr[:2]] = (self.names[piece], {})
+                targets = moves[movestr[:2]][1]
+                piece = self.chess.piece_type_at(move.to_square)
+                if piece is not None:
+                    targets[movestr] = f"capture {self.names[piece]}"
+                else:
+                    targets[movestr] = "move"
+            chess_moves.set(fen, moves)
+        return moves
+
+    def make_move(self, move):
+        if self.winner is None:
+            moves = self.get_moves()
+            if move in moves:
+                self.move = move
+            elif self.move in moves and move in moves[self.move][1]:
+                self.chess.push(chess.Move.from_uci(move))
+                self.move = None
+                self.checkwin()
+                if self.winner is None:
+                    self.turn = (self.turn + 1) % 2
+                    return True
+        return False
+
+    def get_data(self):
+        return {
+            "players": self.players,
+            "board": self.chess.fen(),
+            "type": "Chess",
+            "guild_id": self.guild_id,
+            "move": self.move,
+        }
+
+    def checkwin(self):
+        if self.chess.is_checkmate():
+            # the side to move is the one that got mated
+            self.winner = self.playermap[not self.chess.turn]
+        elif self.chess.is_game_over():
+            # stalemate, insufficient material, or the 75 move and fivefold
+            # repetition rules, none of which need anyone to claim them
+            self.winner = 2
+
+    @classmethod
+    def load_data(cls, data):
+        return cls(data["players"], data["guild_id"], data["board"], data["move"])
@@ -0,0 +1,328 @@
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps as jdumps
+from random import Random
+from time import perf_counter
+import argparse
+import asyncio
+import os
+import tempfile
+import hikari
+import engines
+
+# load test for on_component_interaction: plays N games at once through the
+# real handler with fake interactions and a fake REST client that only waits
+# out a configurable latency, then reports how long clicks took to answer.
+#
+#   python loadtest.py [--games 200] [--seconds 30] [--latency 0.05] [--think 1]
+#                      [--doubles 0.05]
+#
+# main.py is imported with a throwaway config (in memory db, fake tokens) unless
+# QUIGGLE_CONFIG points somewhere else. nothing here talks to discord.
+
+GAMES = ["TicTacToe", "UltTicTacToe", "ConnectFour", "Battleship", "Chess"]
+# discord drops an interaction that hasn't been answered in this long
+DEADLINE = 3.0
+
+
+def load_main(backend):
+    if "QUIGGLE_CONFIG" not in os.environ:
+        config = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+        config.write(
+            jdumps(
+                {
+                    "dburi": ":memory:",
+                    "bottoken": "loadtest",
+                    "debugbottoken": "loadtest",
+                    "debugguilds": [],
+                    "nerds": [],
+                    "state_backend": backend,
+                }
+            )
+        )
+        config.close()
+        os.environ["QUIGGLE_CONFIG"] = config.name
+    import main
+
+    return main
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return "-"
+    picks = []
+    for p in (0.5, 0.95, 0.99):
+        picks.append(values[min(len(values) - 1, int(len(values) * p))])
+    picks.append(values[-1])
+    return "  ".join(f"{v * 1000:>8.1f}" for v in picks)
+
+
+class TimedExecutor(ThreadPoolExecutor):
+    # the db executor, but every call records how long it waited and ran
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = []
+        self.runs = []
+
+    def submit(self, func, *args, **kwargs):
+        queued = perf_counter()
+
+        def timed():
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.waits.append(start - queued)
+                self.runs.append(perf_counter() - start)
+
+        return super().submit(timed)
+
+
+class Object:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Rest:
+    # the REST calls made outside of interaction responses, builders still come
+    # from the real client since they never touch the network
+    def __init__(self, rest, harness):
+        self.rest = rest
+        self.harness = harness
+
+    def build_action_row(self):
+        return self.rest.build_action_row()
+
+    async def create_dm_channel(self, user):
+        await self.harness.rest_call()
+        return Object(id=user)
+
+    async def fetch_guild(self, guild):
+        await self.harness.rest_call()
+        return Object(name=f"guild {guild}")
+
+    async def create_message(self, channel, content=None, **kwargs):
+        await self.harness.rest_call()
+
+
+class Bot:
+    def __init__(self, bot, rest):
+        self.bot = bot
+        self.rest = rest
+
+    def __getattr__(self, name):
+        return getattr(self.bot, name)
+
+
+class Message:
+    def __init__(self, id, content):
+        self.id = id
+        self.content = content
+
+    async def delete(self):
+        pass
+
+    def make_link(self, guild):
+        return f"https://discord.com/channels/{guild}/0/{self.id}"
+
+
+class Interaction(hikari.ComponentInteraction):
+    # just enough of a component interaction for on_component_interaction
+    def __init__(self, harness, message, user, custom_id, values):
+        self.harness = harness
+        self.id = harness.next_id()
+        # the message as it was when clicked, edits go to the shared one
+        self.message = Message(message.id, message.content)
+        self.shared = message
+        self.user = Object(id=user)
+        self.custom_id = custom_id
+        self.values = values
+        self.responded = None
+
+    async def create_initial_response(self, response_type, content=None, **kwargs):
+        await self.harness.rest_call()
+        self.responded = perf_counter()
+        if response_type == hikari.ResponseType.MESSAGE_UPDATE:
+            self.shared.content = content
+
+    async def edit_initial_response(self, content=None, **kwargs):
+        await self.harness.rest_call()
+        self.shared.content = content
+
+    async def execute(self, content=None, **kwargs):
+        await self.harness.rest_call()
+
+
+class Event:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+
+class Harness:
+    def __init__(self, games, seconds, latency, think, doubles, seed):
+        self.games = games
+        self.seconds = seconds
+        self.latency = latency
+        self.think = think
+        self.doubles = doubles
+        self.rng = Random(seed)
+        self.ids = 1000000000000000000
+        self.done = False
+        self.handled = []
+        self.responses = []
+        self.lag = []
+        self.errors = []
+        self.finished = 0
+        self.rest_calls = 0
+
+    def next_id(self):
+        self.ids += 1
+        return self.ids
+
+    async def rest_call(self):
+        self.rest_calls += 1
+        await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.latency)
+
+    async def dispatch(self, message, user, custom_id, values=()):
+        interaction = Interaction(self, message, user, custom_id, list(values))
+        start = perf_counter()
+        try:
+            # hikari runs every listener in its own task
+            await asyncio.create_task(
+                main.on_component_interaction(Event(interaction))
+            )
+        except Exception as e:
+            self.errors.append(repr(e))
+            return
+        self.handled.append(perf_counter() - start)
+        if interaction.responded is not None:
+            self.responses.append(interaction.responded - start)
+
+    async def pick(self, message, players):
+        # a click one of the players could make next, or None once it's over
+        state = main.get_state_string(message.content)
+        if not state:
+            return None
+        data = main.decode(await main.resolve_state(state))
+        game = getattr(engines, data["type"]).load_data(data)
+        if data["type"] == "TicTacToe":
+            game.checkwin()
+        elif data["type"] == "UltTicTacToe":
+            game.metacheckwin()
+        if game.winner is not None:
+            return None
+        rng = self.rng
+        if data["type"] == "Battleship":
+            if game.setup:
+                player = rng.choice(
+                    [
+                        i
+                        for (i, ships) in enumerate(game.pieces)
+                        if any(type(ship) == type(0) for ship in ships)
+                    ]
+                )
+                axis = rng.choice(["x", "y", "d"])
+                if axis == "d":
+                    return (players[player], f"d|{rng.randint(0, 3)}", ())
+                return (players[player], f"{axis}|{rng.randint(0, 9)}", ())
+            axis = "y" if "x" in game.selected[game.turn] else "x"
+            return (players[game.turn], f"{axis}|{rng.randint(0, 9)}", ())
+        user = game.players[game.turn]
+        if data["type"] == "Chess":
+            moves = game.get_moves()
+            if not moves:
+                return None
+            if game.move in moves and rng.random() < 0.8:
+                return (user, "select|-1", [rng.choice(list(moves[game.move][1]))])
+            return (user, "select|-2", [rng.choice(list(moves))])
+        moves = game.get_moves()
+        if not moves:
+            return None
+        return (user, str(rng.choice(moves)), ())
+
+    async def play(self):
+        await asyncio.sleep(self.rng.uniform(0, self.think))
+        while not self.done:
+            players = [self.next_id(), self.next_id()]
+            guild = self.next_id()
+            game = self.rng.choice(GAMES)
+            invite = main.Invite(players, game, guild).build_message()["text"]
+            message = Message(self.next_id(), invite)
+            await self.dispatch(message, players[1], "yes")
+            while not self.done:
+                await asyncio.sleep(self.rng.expovariate(1 / self.think))
+                click = await self.pick(message, players)
+                if click is None:
+                    self.finished += 1
+                    break
+                (user, custom_id, values) = click
+                if self.rng.random() < 0.03:
+                    # somebody clicking out of turn or from outside the game
+                    user = self.rng.choice([players[0], players[1], self.next_id()])
+                if self.rng.random() < self.doubles:
+                    # a double click, both land before either is answered
+                    await asyncio.gather(
+                        self.dispatch(message, user, custom_id, values),
+                        self.dispatch(message, user, custom_id, values),
+                    )
+                else:
+                    await self.dispatch(message, user, custom_id, values)
+
+    async def watch_lag(self, interval=0.01):
+        while not self.done:
+            start = perf_counter()
+            await asyncio.sleep(interval)
+            self.lag.append(perf_counter() - start - interval)
+
+    async def run(self):
+        main.db_executor = TimedExecutor(max_workers=1)
+        main.bot = Bot(main.bot, Rest(main.bot.rest, self))
+        await main.on_started(None)
+        watcher = asyncio.create_task(self.watch_lag())
+        players = [asyncio.create_task(self.play()) for _ in range(self.games)]
+        await asyncio.sleep(self.seconds)
+        self.done = True
+        for player in players:
+            player.cancel()
+        await asyncio.gather(watcher, *players, return_exceptions=True)
+        await main.on_stopping(None)
+
+    def report(self):
+        late = sum(1 for t in self.responses if t > DEADLINE)
+        print(
+            f"{self.games} games for {self.seconds:.0f}s, {len(self.handled)} clicks "
+            f"({len(self.handled) / self.seconds:.1f}/s), {self.finished} finished, "
+            f"{len(self.errors)} errors, {late} answered after {DEADLINE:.0f}s"
+        )
+        print(f"{'ms':<16}{'p50':>8}  {'p95':>8}  {'p99':>8}  {'max':>8}")
+        print(f"{'first response':<16}{percentiles(self.responses)}")
+        print(f"{'handler':<16}{percentiles(self.handled)}")
+        print(f"{'event loop lag':<16}{percentiles(self.lag)}")
+        print(f"{'db wait':<16}{percentiles(main.db_executor.waits)}")
+        print(f"{'db run':<16}{percentiles(main.db_executor.runs)}")
+        print(f"{len(main.db_executor.runs)} db calls, {self.rest_calls} rest calls")
+        outcomes = {}
+        for ((game, outcome), n) in main.interactions.values.items():
+            outcomes[outcome] = outcomes.get(outcome, 0) + n
+        print(", ".join(f"{n} {outcome}" for (outcome, n) in sorted(outcomes.items())))
+        print(f"{sum(main.deferred_responses.values.values())} deferred")
+        for error in sorted(set(self.errors))[:5]:
+            print(f"error: {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=200, help="concurrent games")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--latency", type=float, default=0.05, help="per REST call")
+    parser.add_argument("--think", type=float, default=1.0, help="mean between clicks")
+    parser.add_argument("--doubles", type=float, default=0.05, help="double clicks")
+    parser.add_argument("--backend", choices=["message", "server"], default="message")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main = load_main(args.backend)
+    harness = Harness(
+        args.games, args.seconds, args.latency, args.think, args.doubles, args.seed
+    )
+    asyncio.run(harness.run())
+    harness.report()
@@ -1,17 +1,28 @@
-from time import time
-from random import randint
-from json import dumps as jdumps, loads as jloads
+from time import time, perf_counter
+from functools import wraps
+from contextlib import asynccontextmanager
+from json import loads as jloads
+from random import choice
 import sqlite3
-from zlib import compress as zcompress, decompress as zdecompress
-from codecs import decode as cdecode
+from concurrent.futures import ThreadPoolExecutor
+from struct import pack, unpack
+import asyncio
+import pickle
+import sys
 import lightbulb, hikari
 import os
 import chess
-
-with open("./config.json") as f:
+from cache import LRUCache
+from codec import encode, decode, game_type
+import engines
+import ai
+import metrics
+import profiler
+
+with open(os.environ.get("QUIGGLE_CONFIG", "./config.json")) as f:
     config = jloads(f.read())
 
-db = sqlite3.connect(config["dburi"])
+db = sqlite3.connect(config["dburi"], check_same_thread=False)
 
 setting_defaults = {"dm_notifications": True}
 
@@ -47,56 +58,410 @@ rules = {
 }
 
 
-def get_options(user, option):
+def _get_settings(user):
+    cur = db.cursor()
+    cur.execute("SELECT * FROM USER_SETTINGS WHERE user_id = ?", (user,))
+    response = cur.fetchone()
+    columns = [c[0] for c in cur.description]
+    cur.close()
+    settings = dict(setting_defaults)
+    if response is not None:
+        for (column, value) in zip(columns, response):
+            if column in settings and value is not None:
+                settings[column] = value
+    return settings
+
+
+def _set_options(user, option, setting):
+    if option not in setting_defaults:
+        raise KeyError(option)
+    cur = db.cursor()
+    cur.execute(
+        f"""INSERT INTO USER_SETTINGS (user_id, {option}) VALUES (?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET {option} = excluded.{option}""",
+        (user, setting),
+    )
+    cur.close()
+    db.commit()
+
+
+def _load_state(message_id):
     cur = db.cursor()
     response = cur.execute(
-        f"SELECT setting FROM {option} WHERE user_id = {user}"
+        "SELECT state FROM GAME_STATE WHERE message_id = ?", (message_id,)
     ).fetchone()
     cur.close()
     if response is None:
-        return setting_defaults[option]
+        return None
     return response[0]
 
 
-def set_options(user, option, setting):
+def _save_states(states):
+    cur = db.cursor()
+    try:
+        for (message_id, state) in states:
+            if state is None:
+                cur.execute(
+                    "DELETE FROM GAME_STATE WHERE message_id = ?", (message_id,)
+                )
+            else:
+                cur.execute(
+                    """INSERT INTO GAME_STATE (message_id, state) VALUES (?, ?)
+                    ON CONFLICT (message_id) DO UPDATE SET state = excluded.state""",
+                    (message_id, state),
+                )
+    except Exception:
+        # the whole batch is tried again later, don't leave half of it pending
+        db.rollback()
+        raise
+    finally:
+        cur.close()
+    db.commit()
+
+
+def _log_exception(when, exception):
     cur = db.cursor()
-    cur.execute(f"INSERT OR IGNORE INTO {option} (user_id) VALUES ({user})")
-    cur.execute(f"UPDATE {option} SET setting = {setting} WHERE user_id = {user}")
+    cur.execute("INSERT INTO LOG (user_id, setting) VALUES (?, ?)", (when, exception))
     cur.close()
     db.commit()
 
 
-def get_leaderboard_values(user):
+def _increment_leaderboard_value(user, game):
+    cur = db.cursor()
+    cur.execute(
+        """INSERT INTO WINS (user_id, game, wins) VALUES (?, ?, 1)
+        ON CONFLICT (user_id, game) DO UPDATE SET wins = wins + 1""",
+        (user, game),
+    )
+    cur.close()
+    db.commit()
+
+
+def _get_all_wins():
     cur = db.cursor()
     response = cur.execute(
-        f"""SELECT json FROM LEADERBOARD WHERE user_id = {user}"""
+        "SELECT user_id, game, wins FROM WINS ORDER BY rowid"
+    ).fetchall()
+    cur.close()
+    return response
+
+
+def init_db():
+    cur = db.cursor()
+    cur.execute("CREATE TABLE IF NOT EXISTS LOG (user_id, setting)")
+    cur.execute(
+        """CREATE TABLE IF NOT EXISTS GAME_STATE (
+            message_id INTEGER PRIMARY KEY,
+            state TEXT NOT NULL
+        )"""
+    )
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS USER_SETTINGS (user_id INTEGER PRIMARY KEY)"
+    )
+    columns = []
+    for column in cur.execute("PRAGMA table_info(USER_SETTINGS)").fetchall():
+        columns.append(column[1])
+    for option in setting_defaults.keys():
+        if option in columns:
+            continue
+        cur.execute(f"ALTER TABLE USER_SETTINGS ADD COLUMN {option}")
+        # settings used to live in one table per option
+        legacy = cur.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (option,),
+        ).fetchone()
+        if legacy is not None:
+            cur.execute(
+                f"""INSERT INTO USER_SETTINGS (user_id, {option})
+                SELECT user_id, setting FROM {option} WHERE true
+                ON CONFLICT (user_id) DO UPDATE SET {option} = excluded.{option}"""
+            )
+    cur.execute(
+        """CREATE TABLE IF NOT EXISTS WINS (
+            user_id INTEGER NOT NULL,
+            game TEXT NOT NULL,
+            wins INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, game)
+        )"""
+    )
+    # leaderboards are ranked in memory now, the index only slowed down writes
+    cur.execute("DROP INDEX IF EXISTS WINS_BY_GAME")
+    # one time move of the old per user json blobs into WINS
+    legacy = cur.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'LEADERBOARD'"
     ).fetchone()
+    empty = cur.execute("SELECT 1 FROM WINS LIMIT 1").fetchone() is None
+    if legacy is not None and empty:
+        rows = cur.execute("SELECT user_id, json FROM LEADERBOARD").fetchall()
+        for (user, blob) in rows:
+            if not blob:
+                continue
+            cur.executemany(
+                "INSERT OR IGNORE INTO WINS (user_id, game, wins) VALUES (?, ?, ?)",
+                [(user, game, wins) for (game, wins) in decode(blob).items()],
+            )
     cur.close()
-    if response is None:
-        return decode(encode({}))
-    return decode(response[0])
+    db.commit()
+
+
+# every sqlite call goes through this single thread so a slow commit never
+# blocks the event loop, and writes are applied in the order they were queued
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quiggle-db")
+
+interaction_seconds = metrics.Histogram(
+    "quiggle_interaction_seconds",
+    "Component interaction handling time by game and phase",
+    ["game", "phase"],
+)
+interactions = metrics.Counter(
+    "quiggle_interactions_total",
+    "Component interactions by game and outcome",
+    ["game", "outcome"],
+)
+db_seconds = metrics.Histogram(
+    "quiggle_db_seconds", "Time spent running sqlite calls", ["query"]
+)
+rest_seconds = metrics.Histogram(
+    "quiggle_rest_seconds", "Time spent waiting on discord REST calls", ["call"]
+)
+# fractions of discord's 2000 character message limit
+SIZES = (0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+state_size = metrics.Histogram(
+    "quiggle_state_size_ratio",
+    "Game state length in the message over the 2000 character limit",
+    ["game"],
+    SIZES,
+)
+message_size = metrics.Histogram(
+    "quiggle_message_size_ratio",
+    "Game message length over the 2000 character limit",
+    ["game"],
+    SIZES,
+)
+
+# handlers slower than slow_interaction_seconds get a sampled profile written to
+# the slow_log file, at most one a minute
+slow_log = profiler.SlowLog(
+    config.get("slow_interaction_seconds"), config.get("slow_log", "./slow.log")
+)
+
+
+def observe_phase(trace, game, phase, started):
+    elapsed = perf_counter() - started
+    interaction_seconds.observe(elapsed, game, phase)
+    trace.phase(phase, elapsed)
+
+
+def watched(func):
+    # for command callbacks, goes right above the function
+    @wraps(func)
+    async def callback(ctx):
+        with slow_log.watch(f"/{ctx.command.name}"):
+            await func(ctx)
+
+    return callback
+
+
+# computer opponents search in worker processes so a long search never holds up
+# the gateway. a forked worker would copy whatever threads and locks the bot has
+# going and a spawned one would run all of main.py again, so each worker is a
+# fresh interpreter that only imports ai.py and can be started at any time.
+# every game goes to the same worker, so the search tables a worker keeps for a
+# game are there for its next move
+class ComputerWorker:
+    def __init__(self):
+        self.process = None
+        self.lock = None
+
+    async def start(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        if self.process is not None and self.process.returncode is not None:
+            print(f"computer worker exited with {self.process.returncode}")
+            worker_restarts.inc()
+            self.process = None
+        if self.process is None:
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable,
+                "-c",
+                "import ai; ai.serve()",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                cwd=os.path.dirname(os.path.abspath(ai.__file__)),
+            )
+
+    async def call(self, func, args):
+        data = pickle.dumps((func, args))
+        self.process.stdin.write(pack(">I", len(data)) + data)
+        await self.process.stdin.drain()
+        (size,) = unpack(">I", await self.process.stdout.readexactly(4))
+        return pickle.loads(await self.process.stdout.readexactly(size))
+
+    async def run(self, func, *args):
+        await self.start()
+        async with self.lock:
+            for retry in (True, False):
+                await self.start()
+                try:
+                    # searches stop themselves after ai_seconds, this is for a
+                    # worker that got stuck
+                    (ok, result, reused) = await asyncio.wait_for(
+                        self.call(func, args), ai_seconds + 10
+                    )
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    # it died mid search (killed for memory, crashed). a new one
+                    # gets one more go, without the tables the old one had
+                    print(f"computer worker died: {e!r}")
+                    worker_restarts.inc()
+                    self.stop()
+                    if not retry:
+                        raise
+                except asyncio.TimeoutError:
+                    # too far behind to trust the next reply
+                    worker_restarts.inc()
+                    self.stop()
+                    raise
+        for (cache, found) in reused.items():
+            computer_caches.inc(cache, "hit" if found else "miss")
+        if not ok:
+            raise RuntimeError(f"{func.__name__} failed in the worker: {result}")
+        return result
+
+    def stop(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+        self.process = None
+
+
+if hasattr(os, "sched_getaffinity"):
+    cores = len(os.sched_getaffinity(0))
+else:
+    cores = os.cpu_count() or 1
+ai_workers = [ComputerWorker() for _ in range(config.get("ai_workers", cores))]
+worker_restarts = metrics.Counter(
+    "quiggle_computer_worker_restarts_total",
+    "Computer workers replaced after dying or getting stuck",
+)
+computer_caches = metrics.Counter(
+    "quiggle_computer_cache_total",
+    "Computer searches that found their game's tree or table from the last move",
+    ["cache", "outcome"],
+)
+# time limit for one computer move
+ai_seconds = config.get("ai_seconds", 1.0)
+computer_seconds = metrics.Histogram(
+    "quiggle_computer_move_seconds", "Time spent waiting on computer moves", ["game"]
+)
+
+
+def log_db_error(future):
+    if future.exception() is not None:
+        print(f"database write failed: {future.exception()!r}")
+
+
+def timed_db(func, *args):
+    # runs on the db thread
+    with db_seconds.time(func.__name__.lstrip("_")):
+        return func(*args)
+
+
+async def run_db(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(
+        db_executor, timed_db, func, *args
+    )
+
+
+# per user settings dicts, read through on a miss and dropped whenever the user
+# changes a setting
+settings_cache = LRUCache(maxsize=4096, ttl=600)
+
+
+async def get_options(user, option):
+    settings = settings_cache.get(user)
+    if settings is None:
+        settings = await run_db(_get_settings, user)
+        settings_cache.set(user, settings)
+    return settings[option]
+
+
+async def set_options(user, option, setting):
+    await run_db(_set_options, user, option, setting)
+    settings_cache.pop(user)
+
+
+async def log_exception(exception):
+    await run_db(_log_exception, time(), str(exception))
+
+
+class Leaderboard:
+    # win counts for every user plus a sorted top N per game, kept in memory so
+    # /wins and /leaderboard never touch the database
+    def __init__(self, size=10):
+        self.size = size
+        self.wins = {}
+        self.top = {}
+        self.strings = {}
+
+    def load(self, rows):
+        for (user, game, wins) in rows:
+            self.wins.setdefault(user, {})[game] = wins
+        for game in readable.keys():
+            userlist = []
+            for (user, games) in self.wins.items():
+                if game in games:
+                    userlist.append([user, games[game]])
+            userlist.sort(key=lambda x: x[1], reverse=True)
+            self.top[game] = userlist[: self.size]
+        self.strings = {}
+
+    def add_win(self, user, game):
+        games = self.wins.setdefault(user, {})
+        games[game] = games.get(game, 0) + 1
+        top = self.top.setdefault(game, [])
+        for entry in top:
+            if entry[0] == user:
+                entry[1] = games[game]
+                break
+        else:
+            # counts only ever go up, so nobody outside the top N can be passed
+            # by anyone but the user who just won
+            if len(top) >= self.size and games[game] <= top[-1][1]:
+                return
+            top.append([user, games[game]])
+        top.sort(key=lambda x: x[1], reverse=True)
+        del top[self.size :]
+        self.strings.pop(game, None)
+
+    def get_values(self, user):
+        return self.wins.get(user, {})
+
+    def get_string_for_game(self, game):
+        string = self.strings.get(game)
+        if string is None:
+            string = f"Leaderboard for {readable[game]}"
+            for (user, wins) in self.top.get(game, []):
+                string += f"\n<@{user}>: **{wins}**"
+            self.strings[game] = string
+        return string
+
+
+leaderboard = Leaderboard()
 
 
 def increment_leaderboard_value(user, game):
+    leaderboard.add_win(user, game)
+    # called from the (sync) game classes, so queue the write and move on
     if not dev:
-        cur = db.cursor()
-        values = get_leaderboard_values(user)
-        values[game] = values.get(game, 0) + 1
-
-        cur.execute(
-            f"""INSERT OR IGNORE INTO LEADERBOARD (user_id, json) VALUES ({user}, "")"""
-        )
-        cur.execute(
-            f"""UPDATE LEADERBOARD SET json = "{encode(values)}" WHERE user_id = {user}"""
-        )
-        cur.close()
-        db.commit()
+        db_executor.submit(
+            timed_db, _increment_leaderboard_value, user, game
+        ).add_done_callback(log_db_error)
     else:
         print(f"increment {game} for {user}")
 
 
 def get_leaderboard_string(user):
-    values = get_leaderboard_values(user)
+    values = leaderboard.get_values(user)
     stringey = f"wins for <@{user}>"
     for k in values.keys():
         stringey += f"\n{readable[k]}: **{values[k]}**"
@@ -104,80 +469,78 @@ def get_leaderboard_string(user):
 
 
 def get_leaderboard_string_for_game(game):
-    cur = db.cursor()
-    values = cur.execute("SELECT * FROM LEADERBOARD").fetchall()
-    cur.close()
+    return leaderboard.get_string_for_game(game)
 
-    userlist = []
-    for i in values:
-        uservalue = decode(i[1]).get(game, None)
-        if uservalue is not None:
-            userlist.append([i[0], uservalue])
-        userlist.sort(key=lambda x: x[1], reverse=True)
-    string = f"Leaderboard for {readable[game]}"
-    go = 10
-    if len(userlist) < 10:
-        go = len(userlist)
-    for i in range(go):
-        string += f"\n<@{userlist[i][0]}>: **{userlist[i][1]}**"
-    return string
-
-
-class TicTacToe:
-    def __init__(
-        self,
-        players,
-        guild_id,
-        turn=randint(0, 1),
-        board=[[None, None, None], [None, None, None], [None, None, None]],
-    ):
-        self.players = players
-        self.guild_id = guild_id
-        self.turn = turn
-        self.board = board
+
+# (sub board, cell bit) for every mark on each text line of the ultimate tic tac
+# toe board, grouped by the sub board column it sits in
+BIG_BOARD_LINES = [
+    [[(c * 3 + a, (c * 3 + a) * 9 + b * 3 + d) for d in range(3)] for a in range(3)]
+    for c in range(3)
+    for b in range(3)
+]
+
+
+def freeze(value):
+    # hashable copy of nested lists, for cache keys
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+# rendered board text keyed by game type and whatever the picture depends on,
+# so looking at the same position twice doesn't rebuild it
+renders = LRUCache(maxsize=2048)
+
+# action rows are only read when a response is sent, so one set of builders can
+# back every response whose buttons look the same. nothing may modify them after
+component_templates = LRUCache(maxsize=2048)
+
+
+def cached_components(key, build):
+    components = component_templates.get(key)
+    if components is None:
+        components = build()
+        component_templates.set(key, components)
+    return components
+
+
+class GameAdapter:
+    # the discord side of a game from engines.py, each game adds how it's drawn.
+    # a move that ends the game in a win counts towards the leaderboard
+    def make_move(self, move):
+        winner = self.winner
+        result = super().make_move(move)
+        if (
+            winner is None
+            and self.winner is not None
+            and self.winner != 2
+            and not is_computer(self.players[self.winner])
+        ):
+            increment_leaderboard_value(self.players[self.winner], type(self).__name__)
+        return result
+
+    def computer_clicks(self, move):
+        # the clicks that play a move returned by computer_search or random_move,
+        # the stand in for when the search fails
+        return [str(move)]
+
+
+class TicTacToe(GameAdapter, engines.TicTacToe):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.emojis = ["🇽", "🇴"]
         self.styles = [
             hikari.ButtonStyle.DANGER,
             hikari.ButtonStyle.PRIMARY,
             hikari.ButtonStyle.SECONDARY,
         ]
-        self.winner = None
-
-    def get_moves(self):
-        moves = []
-        for (y, m) in enumerate(self.board):
-            for (x, n) in enumerate(m):
-                if n is None:
-                    moves.append(f"{x}|{y}")
-        return moves
-
-    def make_move(self, move):
-        if move in self.get_moves():
-            if self.winner is None:
-                movep = move.split("|")
-                self.board[int(movep[1])][int(movep[0])] = self.turn
-                self.checkwin()
-                if self.winner is None:
-                    self.turn = (self.turn + 1) % 2
-                    return True
-                else:
-                    if self.winner != 2:
-                        increment_leaderboard_value(
-                            self.players[self.winner], "TicTacToe"
-                        )
-
-        return False
-
-    def get_data(self):
-        return {
-            "players": self.players,
-            "turn": self.turn,
-            "board": self.board,
-            "type": "TicTacToe",
-            "guild_id": self.guild_id,
-        }
 
     def build_components(self):
+        key = ("TicTacToe", tuple(self.bits), self.winner)
+        return cached_components(key, self.render_components)
+
+    def render_components(self):
         components = []
         for (y, n) in enumerate(self.board):
             components.append(bot.rest.build_action_row())
@@ -201,68 +564,25 @@ class TicTacToe:
     def build_message(self):
         if self.winner is None:
             return {
-                "text": f"```{encode(self.get_data())}\n[{readable['TicTacToe']}]```{self.emojis[self.turn]} <@{self.players[self.turn]}>'s turn!",
+                "text": f"```{state_string(self)}\n[{readable['TicTacToe']}]```{self.emojis[self.turn]} <@{self.players[self.turn]}>'s turn!",
                 "components": self.build_components(),
             }
         else:
             if self.winner == 2:
                 return {
-                    "text": f"```{encode(self.get_data())}\n[{readable['TicTacToe']}]```🚮 TIE!",
+                    "text": f"```{state_string(self)}\n[{readable['TicTacToe']}]```🚮 TIE!",
                     "components": self.build_components(),
                 }
             else:
                 return {
-                    "text": f"```{encode(self.get_data())}\n[{readable['TicTacToe']}]```{self.emojis[self.turn]} <@{self.players[self.turn]}> is the WINNER!",
+                    "text": f"```{state_string(self)}\n[{readable['TicTacToe']}]```{self.emojis[self.turn]} <@{self.players[self.turn]}> is the WINNER!",
                     "components": self.build_components(),
                 }
 
-    def checkwin(self):
-        if len(self.get_moves()) == 0:
-            self.winner = 2
-        for i in range(0, 3):
-            if self.board[i][0] == self.board[i][1] == self.board[i][2] and (
-                self.board[i][0] is not None
-            ):
-                self.winner = self.board[i][0]
-                return
-            if self.board[0][i] == self.board[1][i] == self.board[2][i] and (
-                self.board[0][i] is not None
-            ):
-                self.winner = self.board[0][i]
-                return
-        if self.board[0][0] == self.board[1][1] == self.board[2][2] and (
-            self.board[0][0] is not None
-        ):
-            self.winner = self.board[0][0]
-            return
-        if self.board[0][2] == self.board[1][1] == self.board[2][0] and (
-            self.board[0][2] is not None
-        ):
-            self.winner = self.board[0][2]
-            return
 
-    @staticmethod
-    def load_data(data):
-        return TicTacToe(data["players"], data["guild_id"], data["turn"], data["board"])
-
-
-class UltTicTacToe:
-    def __init__(
-        self,
-        players,
-        guild_id,
-        turn=randint(0, 1),
-        board=[
-            [[[None for _ in range(3)] for _ in range(3)] for _ in range(3)]
-            for _ in range(3)
-        ],
-        boardwinners=[[None, None, None], [None, None, None], [None, None, None]],
-        currentboard=[None, None],
-    ):
-        self.players = players
-        self.guild_id = guild_id
-        self.turn = turn
-        self.board = board
+class UltTicTacToe(GameAdapter, engines.UltTicTacToe):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.emojis = ["🇽", "🇴"]
         self.formatted = ["x", "o", "t"]
         self.styles = [
@@ -270,169 +590,47 @@ class UltTicTacToe:
             hikari.ButtonStyle.PRIMARY,
             hikari.ButtonStyle.SECONDARY,
         ]
-        self.winner = None
-        self.boardwinners = boardwinners
-        self.currentboard = currentboard
-
-    def get_data(self):
-        return {
-            "players": self.players,
-            "turn": self.turn,
-            "board": self.board,
-            "type": "UltTicTacToe",
-            "boardwinners": self.boardwinners,
-            "currentboard": self.currentboard,
-            "guild_id": self.guild_id,
-        }
 
-    @staticmethod
-    def load_data(data):
-        return UltTicTacToe(
-            data["players"],
-            data["guild_id"],
-            data["turn"],
-            data["board"],
-            data["boardwinners"],
-            data["currentboard"],
+    def computer_search(self):
+        forced = None
+        if self.currentboard[0] is not None:
+            forced = self.current()
+        return (
+            ai.ult_tic_tac_toe_move,
+            self.bits,
+            self.metabits,
+            forced,
+            self.turn,
+            ai_seconds,
+            getattr(self, "message_id", None),
         )
 
-    def get_moves(self, meta=False):
-        moves = []
-        board = self.boardwinners
-        if self.currentboard[0] is not None and not meta:
-            board = self.board[self.currentboard[1]][self.currentboard[0]]
-        for (y, m) in enumerate(board):
-            for (x, n) in enumerate(m):
-                if n is None:
-                    moves.append(f"{x}|{y}")
-        return moves
-
-    def make_move(self, move):
-        if self.winner is None:
-            meta = False
-            if self.currentboard[0] is None:
-                meta = True
-            if move in self.get_moves():
-                movep = move.split("|")
-                if not meta:
-                    self.board[self.currentboard[1]][self.currentboard[0]][
-                        int(movep[1])
-                    ][int(movep[0])] = self.turn
-                    self.checkwin()
-                self.metacheckwin()
-                if self.boardwinners[int(movep[1])][int(movep[0])] is None:
-                    self.currentboard = [int(movep[1]), int(movep[0])]
-                else:
-                    self.currentboard = [None, None]
-                if self.winner is None and not meta:
-                    self.turn = (self.turn + 1) % 2
-                    return True
-                else:
-                    if self.winner != 2:
-                        increment_leaderboard_value(
-                            self.players[self.winner], "UltTicTacToe"
-                        )
-        return False
-
-    def checkwin(self):
-        if len(self.get_moves()) == 0:
-            self.boardwinners[self.currentboard[0]][self.currentboard[1]] = 2
-        for i in range(0, 3):
-            if self.board[self.currentboard[1]][self.currentboard[0]][i][
-                0
-            ] == self.board[self.currentboard[1]][self.currentboard[0]][i][
-                1
-            ] == self.board[
-                self.currentboard[1]
-            ][
-                self.currentboard[0]
-            ][
-                i
-            ][
-                2
-            ] and (
-                self.board[self.currentboard[1]][self.currentboard[0]][i][0] is not None
-            ):
-                self.boardwinners[self.currentboard[0]][
-                    self.currentboard[1]
-                ] = self.board[self.currentboard[1]][self.currentboard[0]][i][0]
-                return
-            if self.board[self.currentboard[1]][self.currentboard[0]][0][
-                i
-            ] == self.board[self.currentboard[1]][self.currentboard[0]][1][
-                i
-            ] == self.board[
-                self.currentboard[1]
-            ][
-                self.currentboard[0]
-            ][
-                2
-            ][
-                i
-            ] and (
-                self.board[self.currentboard[1]][self.currentboard[0]][0][i] is not None
-            ):
-                self.boardwinners[self.currentboard[0]][
-                    self.currentboard[1]
-                ] = self.board[self.currentboard[1]][self.currentboard[0]][0][i]
-                return
-        if self.board[self.currentboard[1]][self.currentboard[0]][0][0] == self.board[
-            self.currentboard[1]
-        ][self.currentboard[0]][1][1] == self.board[self.currentboard[1]][
-            self.currentboard[0]
-        ][
-            2
-        ][
-            2
-        ] and (
-            self.board[self.currentboard[1]][self.currentboard[0]][0][0] is not None
-        ):
-            self.boardwinners[self.currentboard[0]][self.currentboard[1]] = self.board[
-                self.currentboard[1]
-            ][self.currentboard[0]][0][0]
-            return
-        if self.board[self.currentboard[1]][self.currentboard[0]][0][2] == self.board[
-            self.currentboard[1]
-        ][self.currentboard[0]][1][1] == self.board[self.currentboard[1]][
-            self.currentboard[0]
-        ][
-            2
-        ][
-            0
-        ] and (
-            self.board[self.currentboard[1]][self.currentboard[0]][0][2] is not None
-        ):
-            self.boardwinners[self.currentboard[0]][self.currentboard[1]] = self.board[
-                self.currentboard[1]
-            ][self.currentboard[0]][0][2]
-            return
+    def computer_clicks(self, move):
+        # a free choice of board takes a click to pick the board first
+        (board, cell) = move
+        if self.currentboard[0] is None:
+            return [engines.CELL_MOVES[board], engines.CELL_MOVES[cell]]
+        return [engines.CELL_MOVES[cell]]
 
-    def metacheckwin(self):
-        if len(self.get_moves(True)) == 0:
-            self.winner = 2
-        for i in range(0, 3):
-            if self.boardwinners[i][0] == self.boardwinners[i][1] == self.boardwinners[
-                i
-            ][2] and (self.boardwinners[i][0] is not None):
-                self.winner = self.boardwinners[i][0]
-                return
-            if self.boardwinners[0][i] == self.boardwinners[1][i] == self.boardwinners[
-                2
-            ][i] and (self.boardwinners[0][i] is not None):
-                self.winner = self.boardwinners[0][i]
-                return
-        if self.boardwinners[0][0] == self.boardwinners[1][1] == self.boardwinners[2][
-            2
-        ] and (self.boardwinners[0][0] is not None):
-            self.winner = self.boardwinners[0][0]
-            return
-        if self.boardwinners[0][2] == self.boardwinners[1][1] == self.boardwinners[2][
-            0
-        ] and (self.boardwinners[0][2] is not None):
-            self.winner = self.boardwinners[0][2]
-            return
+    def random_move(self):
+        if self.currentboard[0] is None:
+            board = engines.MOVE_CELLS[choice(self.get_moves())]
+        else:
+            board = self.current()
+        taken = self.sub_board(board, 0) | self.sub_board(board, 1)
+        return (board, choice([i for i in range(9) if not (taken >> i) & 1]))
 
     def build_components(self):
+        key = (
+            "UltTicTacToe",
+            tuple(self.bits),
+            tuple(self.metabits),
+            tuple(self.currentboard),
+            self.winner,
+        )
+        return cached_components(key, self.render_components)
+
+    def render_components(self):
         components = []
         board = self.boardwinners
         if self.currentboard[0] is not None and self.winner is None:
@@ -484,63 +682,64 @@ class UltTicTacToe:
         if self.winner is None:
             if meta:
                 return {
-                    "text": f"```{encode(self.get_data())}\n[{readable['UltTicTacToe']}]{bigboard}```{self.emojis[self.turn]} <@{self.players[self.turn]}>'s turn! pick a board!",
+                    "text": f"```{state_string(self)}\n[{readable['UltTicTacToe']}]{bigboard}```{self.emojis[self.turn]} <@{self.players[self.turn]}>'s turn! pick a board!",
                     "components": self.build_components(),
                 }
             else:
                 return {
-                    "text": f"```{encode(self.get_data())}\n[{readable['UltTicTacToe']}]{bigboard}```{self.emojis[self.turn]} <@{self.players[self.turn]}>'s turn!",
+                    "text": f"```{state_string(self)}\n[{readable['UltTicTacToe']}]{bigboard}```{self.emojis[self.turn]} <@{self.players[self.turn]}>'s turn!",
                     "components": self.build_components(),
                 }
         else:
             if self.winner == 2:
                 return {
-                    "text": f"```{encode(self.get_data())}\n[{readable['UltTicTacToe']}]{bigboard}```🚮 TIE!",
+                    "text": f"```{state_string(self)}\n[{readable['UltTicTacToe']}]{bigboard}```🚮 TIE!",
                     "components": self.build_components(),
                 }
             else:
                 return {
-                    "text": f"```{encode(self.get_data())}\n[{readable['UltTicTacToe']}]{bigboard}```{self.emojis[self.turn]} <@{self.players[self.turn]}> is the WINNER!",
+                    "text": f"```{state_string(self)}\n[{readable['UltTicTacToe']}]{bigboard}```{self.emojis[self.turn]} <@{self.players[self.turn]}> is the WINNER!",
                     "components": self.build_components(),
                 }
 
     def build_big_board(self):
-        string = ""
         filter = True
         if self.winner is None:
             filter = False
-
-        for i in range(3):
-            for j in range(3):
-                string += f"\n{self.get_piece(i, j, 0, 0, filter)}  {self.get_piece(i, j, 0, 1, filter)}  {self.get_piece(i, j, 0, 2, filter)} | {self.get_piece(i, j, 1, 0, filter)}  {self.get_piece(i, j, 1, 1, filter)}  {self.get_piece(i, j, 1, 2, filter)} | {self.get_piece(i, j, 2, 0, filter)}  {self.get_piece(i, j, 2, 1, filter)}  {self.get_piece(i, j, 2, 2, filter)}"
-            if i < 2:
-                string += "\n--------+---------+--------"
-
+        key = ("UltTicTacToe", tuple(self.bits), tuple(self.metabits), filter)
+        string = renders.get(key)
+        if string is None:
+            lines = [""]
+            for (i, line) in enumerate(BIG_BOARD_LINES):
+                lines.append(
+                    " | ".join(
+                        "  ".join(
+                            self.get_piece(n, cell, filter) for (n, cell) in group
+                        )
+                        for group in line
+                    )
+                )
+                if i in (2, 5):
+                    lines.append("--------+---------+--------")
+            string = "\n".join(lines)
+            renders.set(key, string)
         return string
 
-    def get_piece(self, c, b, a, d, filter):
-        if not filter and self.boardwinners[c][a] is not None:
-            return self.formatted[self.boardwinners[c][a]]
+    def get_piece(self, n, cell, filter):
+        winner = engines.mark_at(self.metabits, n)
+        if not filter and winner is not None:
+            return self.formatted[winner]
         else:
-            if self.board[a][c][b][d] is not None:
-                return self.formatted[self.board[a][c][b][d]]
+            piece = engines.mark_at(self.bits, cell)
+            if piece is not None:
+                return self.formatted[piece]
             else:
                 return "_"
 
 
-class ConnectFour:
-    def __init__(
-        self,
-        players,
-        guild_id,
-        turn=randint(0, 1),
-        board=[[None for _ in range(6)] for _ in range(7)],
-    ):
-        self.players = players
-        self.guild_id = guild_id
-        self.turn = turn
-        self.board = board
-        self.winner = None
+class ConnectFour(GameAdapter, engines.ConnectFour):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.nummap = {
             0: "1️⃣",
             1: "2️⃣",
@@ -558,7 +757,7 @@ class ConnectFour:
         self.emojis = [":cow2:", ":racehorse:"]
         self.winningemojis = [":cow:", ":horse:"]
         c = 0
-        for (i, j) in enumerate(players):
+        for (i, j) in enumerate(self.players):
             if j in config["nerds"]:
                 self.emojis[i] = [":nerd:", ":rage:"][c]
                 self.winningemojis[i] = [
@@ -566,48 +765,22 @@ class ConnectFour:
                     ":face_with_symbols_over_mouth:",
                 ][c]
                 c += 1
-        self.winningpieces = [[False for _ in range(6)] for _ in range(7)]
         self.emptyspace = "<:grass:1001630000858013766>"
 
-    def get_moves(self):
-        moves = []
-        for i in range(len(self.board)):
-            if None in self.board[i]:
-                moves.append(i)
-        return moves
+    def build_components(self):
+        if self.winner is not None:
+            return []
+        key = ("ConnectFour", tuple(h < self.height for h in self.heights))
+        return cached_components(key, self.render_components)
 
-    def make_move(self, move):
-        if self.winner is None:
-            move = int(move)
-            if move in self.get_moves():
-                for i in range(len(self.board[move])):
-                    if self.board[move][i] is None:
-                        self.board[move][i] = self.turn
-                        break
-                self.checkwin()
-                if self.winner is None:
-                    self.turn = (self.turn + 1) % 2
-                    return True
-                else:
-                    if self.winner != 2:
-                        increment_leaderboard_value(
-                            self.players[self.winner], "ConnectFour"
-                        )
-        return False
+    def computer_search(self):
+        return (ai.connect_four_move, self.board, self.turn, ai_seconds)
 
-    def get_data(self):
-        return {
-            "players": self.players,
-            "turn": self.turn,
-            "board": self.board,
-            "type": "ConnectFour",
-            "guild_id": self.guild_id,
-        }
+    def random_move(self):
+        return choice(self.get_moves())
 
-    def build_components(self):
+    def render_components(self):
         components = []
-        if self.winner is not None:
-            return components
         moves = self.get_moves()
         for i in range(len(self.board)):
             if (i % 5) == 0:
@@ -630,7 +803,7 @@ class ConnectFour:
         gamemap = self.buildmap()
         if self.winner is None:
             return {
-                "text": f"```{encode(self.get_data())}\n[{readable['ConnectFour']}]```<@{self.players[self.turn]}>'s turn!\n{gamemap}",
+                "text": f"```{state_string(self)}\n[{readable['ConnectFour']}]```<@{self.players[self.turn]}>'s turn!\n{gamemap}",
                 "components": self.build_components(),
             }
         else:
@@ -646,299 +819,66 @@ class ConnectFour:
                 }
 
     def buildmap(self):
-        gamemap = ""
-        for i in range(len(self.board)):
-            gamemap += self.nummap.get(i, ":no_entry:")
-        for i in range(len(self.board[0])):
-            gamemap += "\n"
-            for j in range(len(self.board)):
-                if self.board[j][len(self.board[j]) - i - 1] is None:
-                    gamemap += self.emptyspace
-                else:
-                    if self.winningpieces[j][len(self.board[j]) - i - 1]:
-                        gamemap += self.winningemojis[
-                            self.board[j][len(self.board[j]) - i - 1]
-                        ]
-                    else:
-                        gamemap += self.emojis[
-                            self.board[j][len(self.board[j]) - i - 1]
-                        ]
-        return gamemap
-
-    def checkwin(self):
-        for i in range(len(self.board)):
-            for j in range(len(self.board[i])):
-                if i < (len(self.board) - 3) and j < len(self.board[i]):
-                    if (
-                        self.board[i][j]
-                        == self.board[i + 1][j]
-                        == self.board[i + 2][j]
-                        == self.board[i + 3][j]
-                    ) and self.board[i][j] is not None:
-                        for g in range(4):
-                            self.winningpieces[i + g][j] = True
-                        self.winner = self.board[i][j]
-                        return
-                if i < (len(self.board)) and j < (len(self.board[i]) - 3):
-                    if (
-                        self.board[i][j]
-                        == self.board[i][j + 1]
-                        == self.board[i][j + 2]
-                        == self.board[i][j + 3]
-                    ) and self.board[i][j] is not None:
-                        for g in range(4):
-                            self.winningpieces[i][j + g] = True
-                        self.winner = self.board[i][j]
-                        return
-                if i < (len(self.board) - 3) and j < (len(self.board[i]) - 3):
-                    if (
-                        self.board[i][j]
-                        == self.board[i + 1][j + 1]
-                        == self.board[i + 2][j + 2]
-                        == self.board[i + 3][j + 3]
-                    ) and self.board[i][j] is not None:
-                        for g in range(4):
-                            self.winningpieces[i + g][j + g] = True
-                        self.winner = self.board[i][j]
-                        return
-                if i < (len(self.board) - 3) and j > 2:
-                    if (
-                        self.board[i][j]
-                        == self.board[i + 1][j - 1]
-                        == self.board[i + 2][j - 2]
-                        == self.board[i + 3][j - 3]
-                    ) and self.board[i][j] is not None:
-                        for g in range(4):
-                            self.winningpieces[i + g][j - g] = True
-                        self.winner = self.board[i][j]
-                        return
-        if len(self.get_moves()) == 0:
-            self.winner = 2
-
-    @staticmethod
-    def load_data(data):
-        return ConnectFour(
-            data["players"], data["guild_id"], data["turn"], data["board"]
+        key = (
+            "ConnectFour",
+            freeze(self.board),
+            freeze(self.winningpieces),
+            tuple(self.emojis),
         )
+        gamemap = renders.get(key)
+        if gamemap is None:
+            # (piece, winning) -> emoji, empty cells are never winning
+            cells = {(None, False): self.emptyspace}
+            for (i, emoji) in enumerate(self.emojis):
+                cells[(i, False)] = emoji
+                cells[(i, True)] = self.winningemojis[i]
+            rows = [
+                "".join(self.nummap.get(i, ":no_entry:") for i in range(self.width))
+            ]
+            for row in reversed(range(self.height)):
+                rows.append(
+                    "".join(
+                        cells[(column[row], winning[row])]
+                        for (column, winning) in zip(self.board, self.winningpieces)
+                    )
+                )
+            gamemap = "\n".join(rows)
+            renders.set(key, gamemap)
+        return gamemap
 
 
-class Battleship:
-    def __init__(
-        self,
-        players,
-        guild_id,
-        turn=None,
-        board=[
-            [[None for _ in range(10)] for _ in range(10)],
-            [[None for _ in range(10)] for _ in range(10)],
-        ],
-        setup=True,
-        pieces=[[5, 4, 3, 3, 2] for _ in range(2)],
-        # pieces=[[2] for _ in range(2)],
-        selected=[{}, {}],
-        player=None,
-        winner=None,
-    ):
-        self.players = players
-        self.guild_id = guild_id
-        self.turn = turn
-        self.board = board
-        self.winner = winner
-        self.setup = setup
-        self.pieces = pieces
-        self.piece = None
-        self.meta = None
-        self.selected = selected
+class Battleship(GameAdapter, engines.Battleship):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.axisemotes = [
             ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"],
             ["🇦", "🇧", "🇨", "🇩", "🇪", "🇫", "🇬", "🇭", "🇮", "🇯"],
         ]
         self.diremotes = ["⬆️", "⬇️", "⬅️", "➡️"]
-        self.dirmap = [[-1, 0], [1, 0], [0, -1], [0, 1]]
-        self.player = player
-        self.piecesleft = []
-        if self.player is not None:
-            for (i, j) in enumerate(self.pieces[self.player]):
-                if type(j) == type(0):
-                    if self.piece is None:
-                        self.piece = i
-                    self.piecesleft.append(j)
-        self.hit = ""
-
-    def get_moves(self):
-        moves = []
-        if self.setup:
-            for i in range(10):
-                moves.append(f"y|{i}")
-            for i in range(10):
-                moves.append(f"x|{i}")
-            moves.append("d|0")
-            moves.append("d|1")
-            moves.append("d|2")
-            moves.append("d|3")
-            moves.append("MAP")
-        else:
-            for i in range(10):
-                moves.append(f"y|{i}")
-            for i in range(10):
-                moves.append(f"x|{i}")
-            moves.append("MAP")
-
-        return moves
 
     def make_move(self, move):
-        if self.winner is None:
-            ping = False
-            if move == "MAP":
-                self.meta = "map"
-                return
-            if move in self.get_moves():
-                if self.setup:
-                    movep = move.split("|")
-                    if self.piece is None:
-                        self.meta = "noneleft"
-                        return
-                    if (
-                        self.selected[self.player].get("x", None) is None
-                        or self.selected[self.player].get("y", None) is None
-                    ) and movep[0] == "d":
-                        self.meta = "direction"
-                        return
-                    if movep[0] == "d":
-                        shiplength = self.pieces[self.player][self.piece]
-                        direction = self.dirmap[int(movep[1])]
-                        for i in range(shiplength):
-                            if (
-                                0
-                                > (
-                                    int(self.selected[self.player]["x"])
-                                    + (direction[0] * i)
-                                )
-                                or (
-                                    int(self.selected[self.player]["x"])
-                                    + (direction[0] * i)
-                                )
-                                > 9
-                            ):
-                                self.meta = "offmap"
-                                return
-                            if (
-                                0
-                                > (
-                                    int(self.selected[self.player]["y"])
-                                    + (direction[1] * i)
-                                )
-                                or (
-                                    int(self.selected[self.player]["y"])
-                                    + (direction[1] * i)
-                                )
-                                > 9
-                            ):
-                                self.meta = "offmap"
-                                return
-                            for ship in self.pieces[self.player]:
-                                if not type(ship) == type(0):
-                                    if [
-                                        int(self.selected[self.player]["x"])
-                                        + (direction[0] * i),
-                                        int(self.selected[self.player]["y"])
-                                        + (direction[1] * i),
-                                    ] in ship:
-                                        self.meta = "offmap"
-                                        return
-                        self.pieces[self.player][self.piece] = []
-                        for i in range(shiplength):
-                            self.pieces[self.player][self.piece].append(
-                                [
-                                    int(self.selected[self.player]["x"])
-                                    + (direction[0] * i),
-                                    int(self.selected[self.player]["y"])
-                                    + (direction[1] * i),
-                                ]
-                            )
-                        self.selected[self.player] = {}
-                    else:
-                        self.selected[self.player][movep[0]] = movep[1]
-                else:
-                    movep = move.split("|")
-                    if self.player != self.turn:
-                        self.meta = "noturturn"
-                        return
-
-                    if (
-                        movep[0] == "x"
-                        and self.selected[self.turn].get("y", None) is not None
-                    ):
-                        if (
-                            self.board[self.turn][int(movep[1])][
-                                self.selected[self.turn]["y"]
-                            ]
-                            is not None
-                        ):
-                            self.meta = "alreadyhit"
-                            return
-                    if (
-                        movep[0] == "y"
-                        and self.selected[self.turn].get("x", None) is not None
-                    ):
-                        if (
-                            self.board[self.turn][self.selected[self.turn]["x"]][
-                                int(movep[1])
-                            ]
-                            is not None
-                        ):
-                            self.meta = "alreadyhit"
-                            return
-
-                    self.selected[self.turn][movep[0]] = int(movep[1])
-
-                    x = self.selected[self.turn].get("x", None)
-                    y = self.selected[self.turn].get("y", None)
-
-                    if x is not None and y is not None:
-                        hit = False
-                        for i in self.pieces[(self.turn + 1) % 2]:
-                            for j in i:
-                                if j == [x, y]:
-                                    hit = True
-                                    break
-                            if hit:
-                                break
-                        self.board[self.turn][x][y] = hit
-                        if hit:
-                            self.hit = ":boom: HIT! "
-                        else:
-                            self.hit = ":dash: MISS! "
-                        self.selected[self.turn] = {}
-                    else:
-                        self.meta = "updateboard"
-                        return
-                self.checkwin()
-                if self.winner is None and not self.setup:
-                    self.turn = (self.turn + 1) % 2
-                    ping = True
-                elif not self.setup:
-                    if self.winner != 2:
-                        increment_leaderboard_value(
-                            self.players[self.winner], "Battleship"
-                        )
-            return ping
-
-    def get_data(self):
-        data = {
-            "players": self.players,
-            "turn": self.turn,
-            "board": self.board,
-            "setup": self.setup,
-            "type": "Battleship",
-            "guild_id": self.guild_id,
-            "pieces": self.pieces,
-            "selected": self.selected,
-            "winner": self.winner,
-        }
-        return data
+        if self.winner is None and move == "MAP":
+            self.meta = "map"
+            return
+        return super().make_move(move)
+
+    @property
+    def hit(self):
+        if self.shot is None:
+            return ""
+        if not self.shot:
+            return ":dash: MISS! "
+        if self.sunk is not None:
+            return f":boom: HIT! You sank their {self.ship_name(self.sunk)}! "
+        return ":boom: HIT! "
 
     def build_components(self):
+        # the keypad only changes between setup and attacking
+        if self.winner is not None:
+            return []
+        return cached_components(("Battleship", self.setup), self.render_components)
+
+    def render_components(self):
         components = []
         if self.winner is None:
             for i in range(10):
@@ -979,152 +919,98 @@ class Battleship:
         return components
 
     def build_map(self, secret=False, player=None):
-        gamemap = ""
+        # player is whose ships are drawn, seamap is the attack board drawn over
+        # them and selected is the half picked coordinate to highlight
         if self.winner is None:
             if self.setup:
-                seamap = self.board[self.player]
-                ships = self.pieces[self.player]
-                selected = []
-                selected.append(self.selected[self.player].get("x", None))
-                selected.append(self.selected[self.player].get("y", None))
-                selected.append(self.selected[self.player].get("d", None))
-
-                for i in range(len(selected)):
-                    if selected[i] is not None:
-                        selected[i] = int(selected[i])
-
-                for i in ships:
-                    if not (type(i) == type(0)):
-                        for j in i:
-                            seamap[j[0]][j[1]] = "filled"
-                topbar = ""
-                if selected[2] is None:
-                    topbar += ":black_large_square:"
-                else:
-                    topbar += self.diremotes[selected[2]]
-                for i in range(10):
-                    topbar += self.axisemotes[0][i]
-                if self.piece == None:
-                    gamemap += (
-                        f"```\nAll pieces selected, waiting on other player!```{topbar}"
-                    )
-                else:
-                    gamemap += f"```\nselecting space for a {self.pieces[self.player][self.piece]} tile long ship\nShips left:\n{str(self.piecesleft).replace('[', '').replace(']', '')}```{topbar}"
-                for i in range(len(seamap)):
-                    gamemap += f"\n{self.axisemotes[1][i]}"
-                    for j in range(len(seamap[0])):
-                        if seamap[i][j] is None:
-                            if selected[0] is not None and selected[1] is None:
-                                if i == selected[0]:
-                                    gamemap += ":traffic_light:"
-                                else:
-                                    gamemap += ":ocean:"
-                            elif selected[0] is None and selected[1] is not None:
-                                if j == selected[1]:
-                                    gamemap += ":vertical_traffic_light:"
-                                else:
-                                    gamemap += ":ocean:"
-                            elif selected[0] is not None and selected[1] is not None:
-                                if i == selected[0] and j == selected[1]:
-                                    gamemap += ":negative_squared_cross_mark:"
-                                else:
-                                    gamemap += ":ocean:"
-                            else:
-                                gamemap += ":ocean:"
-                        else:
-                            gamemap += ":ship:"
+                view = "setup"
+                player = self.player
+                seamap = None
+                selected = self.selected[self.player]
+            elif secret:
+                view = "secret"
+                player = self.player
+                seamap = None
+                selected = {}
             else:
-                if secret:
-                    player = self.player
-                    seamap = [[None for _ in range(10)] for _ in range(10)]
-                    ships = self.pieces[player]
-                    for i in ships:
-                        if not (type(i) == type(0)):
-                            for j in i:
-                                seamap[j[0]][j[1]] = "filled"
-                    gamemap += ":black_large_square:"
-                    for i in range(10):
-                        gamemap += self.axisemotes[0][i]
-                    for i in range(len(seamap)):
-                        gamemap += f"\n{self.axisemotes[1][i]}"
-                        for j in range(len(seamap[0])):
-                            if seamap[i][j] is None:
-                                gamemap += ":ocean:"
-                            else:
-                                gamemap += ":ship:"
-                else:
-                    player = (self.turn + 1) % 2
-                    shipmap = [[None for _ in range(10)] for _ in range(10)]
-                    ships = self.pieces[player]
-                    for i in ships:
-                        if not (type(i) == type(0)):
-                            for j in i:
-                                shipmap[j[0]][j[1]] = "filled"
-                    seamap = self.board[self.turn]
-                    selected = []
-                    selected.append(self.selected[self.turn].get("x", None))
-                    selected.append(self.selected[self.turn].get("y", None))
-                    for i in range(len(selected)):
-                        if selected[i] is not None:
-                            selected[i] = int(selected[i])
-                    gamemap += ":black_large_square:"
-                    for i in range(10):
-                        gamemap += self.axisemotes[0][i]
-                    for i in range(len(seamap)):
-                        gamemap += f"\n{self.axisemotes[1][i]}"
-                        for j in range(len(seamap[0])):
-                            if seamap[i][j] is None:
-                                if selected[0] is not None and selected[1] is None:
-                                    if i == selected[0]:
-                                        gamemap += ":traffic_light:"
-                                    else:
-                                        gamemap += ":ocean:"
-                                elif selected[0] is None and selected[1] is not None:
-                                    if j == selected[1]:
-                                        gamemap += ":vertical_traffic_light:"
-                                    else:
-                                        gamemap += ":ocean:"
-                                else:
-                                    gamemap += ":ocean:"
-                            else:
-                                if shipmap[i][j] is None:
-                                    gamemap += ":dash:"
-                                else:
-                                    gamemap += ":boom:"
+                view = "attack"
+                player = (self.turn + 1) % 2
+                seamap = self.board[self.turn]
+                selected = self.selected[self.turn]
         else:
+            view = "winner"
             if player is None:
                 player = self.player
             seamap = self.board[(player + 1) % 2]
-            shipmap = [[None for _ in range(10)] for _ in range(10)]
-            ships = self.pieces[player]
-            for i in ships:
-                if not (type(i) == type(0)):
-                    for j in i:
-                        shipmap[j[0]][j[1]] = "filled"
-            gamemap += ":black_large_square:"
-            for i in range(10):
-                gamemap += self.axisemotes[0][i]
-            for i in range(len(seamap)):
-                gamemap += f"\n{self.axisemotes[1][i]}"
-                for j in range(len(seamap[0])):
-                    if seamap[i][j] is None:
-                        if shipmap[i][j] is None:
-                            gamemap += ":ocean:"
-                        else:
-                            gamemap += ":ship:"
-                    else:
-                        if shipmap[i][j] is None:
-                            gamemap += ":dash:"
-                        else:
-                            gamemap += ":boom:"
+            selected = {}
+        key = (
+            "Battleship",
+            view,
+            freeze(seamap),
+            freeze(self.pieces[player]),
+            tuple(sorted(selected.items())),
+        )
+        gamemap = renders.get(key)
+        if gamemap is None:
+            gamemap = self.render_map(view, player, seamap, selected)
+            renders.set(key, gamemap)
         return gamemap
 
+    def render_map(self, view, player, seamap, selected):
+        ships = self.shipindex[player]
+        # (shot at, ship there) -> emoji, ships are hidden on the attack board
+        cells = {
+            (False, False): ":ocean:",
+            (False, True): ":ship:",
+            (True, False): ":dash:",
+            (True, True): ":boom:",
+        }
+        if view == "attack":
+            cells[(False, True)] = ":ocean:"
+        x = selected.get("x", None)
+        y = selected.get("y", None)
+        if x is not None:
+            x = int(x)
+        if y is not None:
+            y = int(y)
+        topbar = ":black_large_square:"
+        if view == "setup":
+            direction = selected.get("d", None)
+            if direction is not None:
+                topbar = self.diremotes[int(direction)]
+        topbar += "".join(self.axisemotes[0])
+        if view != "setup":
+            gamemap = topbar
+        elif self.piece == None:
+            gamemap = f"```\nAll pieces selected, waiting on other player!```{topbar}"
+        else:
+            gamemap = f"```\nselecting space for a {self.pieces[self.player][self.piece]} tile long ship\nShips left:\n{str(self.piecesleft).replace('[', '').replace(']', '')}```{topbar}"
+        rows = [gamemap]
+        for i in range(10):
+            row = [self.axisemotes[1][i]]
+            for j in range(10):
+                shot = seamap is not None and seamap[i][j] is not None
+                cell = cells[(shot, (i, j) in ships)]
+                if cell == ":ocean:":
+                    if x is not None and y is None:
+                        if i == x:
+                            cell = ":traffic_light:"
+                    elif x is None and y is not None:
+                        if j == y:
+                            cell = ":vertical_traffic_light:"
+                    elif x is not None and view == "setup":
+                        if i == x and j == y:
+                            cell = ":negative_squared_cross_mark:"
+                row.append(cell)
+            rows.append("".join(row))
+        return "\n".join(rows)
+
     def build_message(self):
         if self.winner is None:
             if self.setup:
                 if self.player is None:
                     return {
-                        "text": f"```{encode(self.get_data())}\n[{readable['Battleship']}]```SETUP!",
+                        "text": f"```{state_string(self)}\n[{readable['Battleship']}]```SETUP!",
                         "components": self.build_components(),
                     }
                 else:
@@ -1154,7 +1040,7 @@ class Battleship:
                         }
                     else:
                         return {
-                            "text": f"```{encode(self.get_data())}\n[{readable['Battleship']}]```SETUP!",
+                            "text": f"```{state_string(self)}\n[{readable['Battleship']}]```SETUP!",
                             "components": self.build_components(),
                         }
             else:
@@ -1178,7 +1064,7 @@ class Battleship:
                     }
 
                 return {
-                    "text": f"```{encode(self.get_data())}\n[{readable['Battleship']}]```{self.hit}<@{self.players[self.turn]}>'s turn!\n{self.build_map()}",
+                    "text": f"```{state_string(self)}\n[{readable['Battleship']}]```{self.hit}<@{self.players[self.turn]}>'s turn!\n{self.build_map()}",
                     "components": self.build_components(),
                 }
         else:
@@ -1195,67 +1081,14 @@ class Battleship:
                 "components": self.build_components(),
             }
 
-    def checkwin(self):
-        if self.setup:
-            totalleft = 0
-            for i in self.pieces[0]:
-                if type(i) == type(1):
-                    totalleft += 1
-            for i in self.pieces[1]:
-                if type(i) == type(1):
-                    totalleft += 1
-            if totalleft == 0:
-                self.setup = False
-                self.turn = randint(0, 1)
-        else:
-            hitcount = 0
-            for i in self.board[self.turn]:
-                for j in i:
-                    if j == True:
-                        hitcount += 1
-            if hitcount == 17:
-                self.winner = self.turn
-
-    @staticmethod
-    def load_data(data, player=None):
-        if player is not None:
-            for (i, j) in enumerate(data["players"]):
-                if player == j:
-                    player = i
-                    break
-        return Battleship(
-            data["players"],
-            data["guild_id"],
-            data["turn"],
-            data["board"],
-            data["setup"],
-            data["pieces"],
-            data["selected"],
-            player,
-            data["winner"],
-        )
-
     @staticmethod
     def handlemsg():
         return True
 
 
-class Chess:
-    def __init__(self, players, guild_id, board=None, move=None):
-        self.guild_id = guild_id
-        if board is None:
-            self.chess = chess.Board()
-            if randint(0, 1) == 0:
-                self.players = [players[1], players[0]]
-            else:
-                self.players = players
-        else:
-            self.chess = chess.Board(board)
-            self.players = players
-        self.winner = None
-        self.playermap = {chess.WHITE: 0, chess.BLACK: 1}
-        self.turn = self.playermap[self.chess.turn]
-        self.move = move
+class Chess(GameAdapter, engines.Chess):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.emojis = [
             [":white_circle:", ":black_circle:"],
             [
@@ -1311,56 +1144,17 @@ class Chess:
                 "<:8_:878210060856229938>",
             ],
         ]
-        self.names = ["", "Pawn", "Knight", "Bishop", "Rook", "Queen", "King"]
-
-    def get_moves(self):
-        moves = [[[], []], [[], []]]
-        for move in self.chess.legal_moves:
-            movestr = move.uci()
-            if movestr[:2] not in moves[0][0]:
-                moves[0][0].append(movestr[:2])
-                moves[1][0].append(
-                    self.names[
-                        int(f"{self.chess.piece_at(move.from_square).piece_type}")
-                    ]
-                )
-            if self.move is not None:
-                if self.move == movestr[:2] and movestr[2:] not in moves[0][1]:
-                    moves[0][1].append(movestr)
-                    piece = self.chess.piece_at(move.to_square)
-                    if piece is not None:
-                        moves[1][1].append(
-                            f"capture {self.names[int(f'{piece.piece_type}')]}"
-                        )
-                    else:
-                        moves[1][1].append("move")
-        return moves
 
-    def make_move(self, move):
-        if self.winner is None:
-            moves = self.get_moves()
-            if move in moves[0][0]:
-                self.move = move
-            elif move in moves[0][1]:
-                self.chess.push(chess.Move.from_uci(move))
-                self.move = None
-                self.checkwin()
-                if self.winner is None:
-                    self.turn = (self.turn + 1) % 2
-                    return True
-                else:
-                    if self.winner != 2:
-                        increment_leaderboard_value(self.players[self.winner], "Chess")
-        return False
+    def computer_search(self):
+        game = getattr(self, "message_id", None)
+        return (ai.chess_move, self.chess.fen(), ai_seconds, game)
 
-    def get_data(self):
-        return {
-            "players": self.players,
-            "board": self.chess.fen(),
-            "type": "Chess",
-            "guild_id": self.guild_id,
-            "move": self.move,
-        }
+    def computer_clicks(self, move):
+        # pick the piece, then where it goes
+        return [move[:2], move]
+
+    def random_move(self):
+        return choice(list(self.chess.legal_moves)).uci()
 
     def build_components(self):
         components = []
@@ -1368,12 +1162,12 @@ class Chess:
         row = bot.rest.build_action_row()
         s = row.add_select_menu("select|-2")
         # s.add_option("select piece to move", "ignore").set_is_default(True).add_to_menu()
-        for (i, move) in enumerate(moves[0][0]):
+        for (move, (name, _)) in moves.items():
             default = False
             if move == self.move:
                 default = True
             s.add_option(f"{move}".upper(), move).set_description(
-                moves[1][0][i]
+                name
             ).set_is_default(default).add_to_menu()
         s.add_to_container()
         components.append(row)
@@ -1383,7 +1177,8 @@ class Chess:
         if self.move is None:
             s.set_is_disabled(True)
         else:
-            for (i, move) in enumerate(moves[0][1]):
+            targets = moves.get(self.move, (None, {}))[1]
+            for (i, (move, description)) in enumerate(targets.items()):
                 if (i % 20) == 0:
                     if i != 0:
                         s.add_to_container()
@@ -1394,26 +1189,44 @@ class Chess:
                             True
                         ).add_to_menu()
                 s.add_option(f"{move}".upper(), move).set_description(
-                    moves[1][1][i]
+                    description
                 ).add_to_menu()
         s.add_to_container()
         components.append(row)
         return components
 
     def build_board(self):
-        board = "<:quiggle:897058047137030184><:a_:878071110481117205><:b_:878071110544003114><:c_:878071110862766120><:d_:878071110455939104><:e_:878071110749532171><:f_:878071110510465106><:g_:878071110996987935><:h_:878071110892146728><:quiggle:897058047137030184>"
-        for rank in range(8):
-            board += f"\n{self.emojis[2][7 - rank]}"
-            for file in range(8):
-                piece = self.chess.piece_at(chess.square(file, 7 - rank))
-                if piece is None:
-                    board += self.emojis[1][(file + rank) % 2][chess.WHITE][None]
-                else:
-                    board += self.emojis[1][(file + rank) % 2][piece.color][
-                        piece.piece_type
-                    ]
-            board += f"{self.emojis[2][7 - rank]}"
-        board += "\n<:quiggle:897058047137030184><:a_:878071110481117205><:b_:878071110544003114><:c_:878071110862766120><:d_:878071110455939104><:e_:878071110749532171><:f_:878071110510465106><:g_:878071110996987935><:h_:878071110892146728><:quiggle:897058047137030184>"
+        key = ("Chess", self.chess.board_fen())
+        board = renders.get(key)
+        if board is None:
+            edge = "<:quiggle:897058047137030184><:a_:878071110481117205><:b_:878071110544003114><:c_:878071110862766120><:d_:878071110455939104><:e_:878071110749532171><:f_:878071110510465106><:g_:878071110996987935><:h_:878071110892146728><:quiggle:897058047137030184>"
+            # fen piece letter -> emoji, for light and dark squares
+            tiles = []
+            for squares in self.emojis[1]:
+                tile = {None: squares[chess.WHITE][None]}
+                for color in (chess.WHITE, chess.BLACK):
+                    for (piece, emoji) in squares[color].items():
+                        if piece is not None:
+                            tile[chess.Piece(piece, color).symbol()] = emoji
+                tiles.append(tile)
+            rows = [edge]
+            # board_fen lists ranks from 8 down to 1, digits are runs of empty squares
+            for (rank, pieces) in enumerate(key[1].split("/")):
+                row = [self.emojis[2][7 - rank]]
+                file = 0
+                for piece in pieces:
+                    if piece.isdigit():
+                        for _ in range(int(piece)):
+                            row.append(tiles[(file + rank) % 2][None])
+                            file += 1
+                    else:
+                        row.append(tiles[(file + rank) % 2][piece])
+                        file += 1
+                row.append(self.emojis[2][7 - rank])
+                rows.append("".join(row))
+            rows.append(edge)
+            board = "\n".join(rows)
+            renders.set(key, board)
         return board
 
     def build_message(self):
@@ -1429,25 +1242,23 @@ class Chess:
         )
         if self.winner is None:
             return {
-                "text": f"```{bn}{encode(self.get_data())}\n[{readable['Chess']}]```<@{self.players[self.playermap[self.chess.turn]]}>",
+                "text": f"```{bn}{state_string(self)}\n[{readable['Chess']}]```<@{self.players[self.playermap[self.chess.turn]]}>",
                 "embed": embed,
                 "components": self.build_components(),
             }
+        elif self.winner == 2:
+            embed.title = "🚮 DRAW!"
+            return {
+                "text": f"```{bn}\n[{readable['Chess']}]```<@{self.players[0]}> <@{self.players[1]}>",
+                "embed": embed,
+            }
         else:
-            embed.title = f"{self.emojis[0][(self.playermap[self.chess.turn] + 1) % 2]} is the WINNER!"
+            embed.title = f"{self.emojis[0][self.winner]} is the WINNER!"
             return {
-                "text": f"```{bn}\n[{readable['Chess']}]```<@{self.players[(self.playermap[self.chess.turn] + 1) % 2]}>",
+                "text": f"```{bn}\n[{readable['Chess']}]```<@{self.players[self.winner]}>",
                 "embed": embed,
             }
 
-    def checkwin(self):
-        if self.chess.is_checkmate():
-            self.winner = self.playermap[self.chess.turn]
-
-    @staticmethod
-    def load_data(data):
-        return Chess(data["players"], data["guild_id"], data["board"], data["move"])
-
 
 class Invite:
     def __init__(self, players, game, guild_id):
@@ -1467,10 +1278,14 @@ class Invite:
 
     def build_message(self):
         return {
-            "text": f"<@{self.players[1]}> you have been challenged to a game of\n```{encode(self.get_data())}\n[{readable[self.game]}]```by <@{self.players[0]}>, do you accept?",
+            "text": f"<@{self.players[1]}> you have been challenged to a game of\n```{state_string(self)}\n[{readable[self.game]}]```by <@{self.players[0]}>, do you accept?",
             "components": self.build_components(),
         }
 
+    @staticmethod
+    def load_data(data):
+        return Invite(data["players"], data["game"], data["guild_id"])
+
     def get_data(self):
         return {
             "type": "Invite",
@@ -1480,13 +1295,8 @@ class Invite:
         }
 
 
-def encode(data: dict):
-    return zcompress(bytes(jdumps(data), "utf-8")).hex()
-
-
-def decode(string: str):
-    return jloads(zdecompress(cdecode(string, "hex")).decode("utf-8"))
-
+init_db()
+leaderboard.load(_get_all_wins())
 
 bot = lightbulb.BotApp(
     token=token,
@@ -1495,16 +1305,449 @@ bot = lightbulb.BotApp(
 )
 
 
+def is_computer(user):
+    # games against the computer have the bot's own user as the other player
+    me = bot.get_me()
+    return me is not None and user == me.id
+
+
+def computer_to_move(game):
+    return (
+        hasattr(game, "computer_search")
+        and game.winner is None
+        and is_computer(game.players[game.turn])
+    )
+
+
 def getClass(name):
     return globals()[name]
 
 
+def get_state_string(content):
+    return content.split("```")[1].split("[")[0].strip()
+
+
+# games still being played, keyed by the message they live in and a hash of the
+# state string in it. a click on an unchanged message skips decoding and
+# rebuilding the game, anything else falls back to decoding the message
+live_games = LRUCache(maxsize=1024)
+
+
+async def load_game(message_id, state, user):
+    game = live_games.pop((message_id, hash(state)))
+    if game is None:
+        data = decode(await resolve_state(state))
+        gameclass = getClass(data["type"])
+        if hasattr(gameclass, "handlemsg"):
+            return gameclass.load_data(data, user)
+        return gameclass.load_data(data)
+    if hasattr(type(game), "handlemsg"):
+        game.set_player(game.player_index(game.players, user))
+    return game
+
+
+# optional server side state: game messages only carry "#<message id>" and the
+# packed state lives here, with changes written to sqlite in the background
+class StateStore:
+    def __init__(self, interval=5.0, maxsize=4096):
+        self.interval = interval
+        self.states = LRUCache(maxsize=maxsize)
+        self.dirty = {}
+        self.task = None
+
+    def put(self, message_id, state):
+        self.states.set(message_id, state)
+        self.dirty[message_id] = state
+
+    def drop(self, message_id):
+        self.states.pop(message_id)
+        self.dirty[message_id] = None
+
+    def peek(self, message_id):
+        if message_id in self.dirty:
+            return self.dirty[message_id]
+        return self.states.get(message_id)
+
+    async def get(self, message_id):
+        if message_id in self.dirty:
+            state = self.dirty[message_id]
+        else:
+            state = self.states.get(message_id)
+            if state is None:
+                state = await run_db(_load_state, message_id)
+                if state is not None:
+                    self.states.set(message_id, state)
+        if state is None:
+            raise KeyError(f"no stored state for {message_id}")
+        return state
+
+    async def flush(self):
+        if len(self.dirty) > 0:
+            (dirty, self.dirty) = (self.dirty, {})
+            try:
+                await run_db(_save_states, list(dirty.items()))
+            except Exception:
+                # keep the batch for the next flush, under anything newer that
+                # changed while it was being written
+                dirty.update(self.dirty)
+                self.dirty = dirty
+                raise
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"failed to save game states: {e!r}")
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        await self.flush()
+
+
+state_store = None
+if config.get("state_backend", "message") == "server":
+    state_store = StateStore()
+
+
+def state_string(game):
+    state = encode(game.get_data())
+    message_id = getattr(game, "message_id", None)
+    if state_store is not None and message_id is not None:
+        # stored by track_message once the message showing it has been sent
+        game.unsaved_state = state
+        return f"#{message_id}"
+    return state
+
+
+async def resolve_state(state):
+    if state.startswith("#"):
+        return await state_store.get(int(state[1:]))
+    return state
+
+
+def peek_state(state):
+    if state.startswith("#"):
+        return state_store.peek(int(state[1:]))
+    return state
+
+
+def keep_game(message_id, state, game):
+    # a game waiting on the computer is about to change, and if the computer's
+    # move never lands the next click should decode the message as it is
+    if (
+        not isinstance(game, Invite)
+        and game.winner is None
+        and not computer_to_move(game)
+    ):
+        live_games.set((message_id, hash(state)), game)
+
+
+# clicks on the same game message are handled one at a time. the lock for a
+# message goes away once nothing holds or waits on it
+class MessageLocks:
+    def __init__(self):
+        self.locks = {}
+
+    @asynccontextmanager
+    async def hold(self, message_id):
+        entry = self.locks.get(message_id)
+        if entry is None:
+            entry = [asyncio.Lock(), 0]
+            self.locks[message_id] = entry
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.locks[message_id]
+
+    def busy(self, message_id):
+        return message_id in self.locks
+
+
+message_locks = MessageLocks()
+# interaction ids already handled, the gateway can deliver an event twice
+seen_interactions = LRUCache(maxsize=8192, ttl=900)
+# clicks waiting on or holding a message lock, an identical click from the same
+# user on the same message content is a double click and gets dropped
+pending_clicks = set()
+# (version, state string, game type) of the last edit made to each game message,
+# a click on any other version was made on a message that has been replaced since
+latest_messages = LRUCache(maxsize=4096, ttl=3600)
+
+
+def track_message(message_id, game, text):
+    # after an edit to a game message, returns the state string in it
+    state = get_state_string(text)
+    if state.startswith("#"):
+        state_store.put(message_id, game.unsaved_state)
+    keep_game(message_id, state, game)
+    latest_messages.set(
+        message_id, (message_version(text, state), state, type(game).__name__)
+    )
+    return state
+
+
+def message_version(text, state):
+    # server side states keep the same "#<message id>" string from one edit to
+    # the next, so those go by the text instead
+    if state.startswith("#"):
+        return hash(text.strip())
+    return state
+
+
+async def acknowledge(interaction):
+    # answers the interaction without touching the message
+    with rest_seconds.time("create_initial_response"):
+        await interaction.create_initial_response(
+            hikari.ResponseType.DEFERRED_MESSAGE_UPDATE
+        )
+
+
+# discord drops an interaction that hasn't been answered within 3 seconds. this
+# keeps a moving average of how long the work before the response takes for
+# each kind of click, and when the time already spent plus that would go over
+# the budget the click is acknowledged first and answered with an edit after
+class Deadline:
+    def __init__(self, budget=1.5, weight=0.2):
+        self.budget = budget
+        self.weight = weight
+        self.estimates = {}
+
+    def should_defer(self, key, elapsed):
+        return elapsed + self.estimates.get(key, 0.0) > self.budget
+
+    def record(self, key, seconds):
+        estimate = self.estimates.get(key)
+        if estimate is None:
+            self.estimates[key] = seconds
+        else:
+            self.estimates[key] = estimate + self.weight * (seconds - estimate)
+
+
+deadline = Deadline(config.get("response_budget_seconds", 1.5))
+deferred_responses = metrics.Counter(
+    "quiggle_deferred_responses_total",
+    "Clicks acknowledged before their response was built",
+    ["game"],
+)
+
+
+async def respond(interaction, message, deferred):
+    # sends a build_message style dict as the response to a click, or as the
+    # edit or followup that finishes one that was already acknowledged
+    responsetype = message.get("responsetype", hikari.ResponseType.MESSAGE_UPDATE)
+    if not deferred:
+        with rest_seconds.time("create_initial_response"):
+            await interaction.create_initial_response(
+                responsetype,
+                message["text"],
+                embed=message.get("embed", hikari.UNDEFINED),
+                embeds=message.get("embeds", hikari.UNDEFINED),
+                flags=message.get("flags", hikari.MessageFlag.EPHEMERAL),
+                components=message.get("components", []),
+            )
+    elif responsetype == hikari.ResponseType.MESSAGE_CREATE:
+        with rest_seconds.time("execute"):
+            await interaction.execute(
+                message["text"],
+                embed=message.get("embed", hikari.UNDEFINED),
+                embeds=message.get("embeds", hikari.UNDEFINED),
+                flags=message.get("flags", hikari.MessageFlag.EPHEMERAL),
+                components=message.get("components", []),
+            )
+    else:
+        with rest_seconds.time("edit_initial_response"):
+            await interaction.edit_initial_response(
+                message["text"],
+                embed=message.get("embed", hikari.UNDEFINED),
+                embeds=message.get("embeds", hikari.UNDEFINED),
+                components=message.get("components", []),
+            )
+
+
+# things a turn notification needs that rarely change, so a DM normally costs a
+# single create_message call
+dm_channels = LRUCache(maxsize=4096, ttl=3600)
+guild_names = LRUCache(maxsize=4096, ttl=3600)
+
+
+async def get_dm_channel(user_id):
+    channel_id = dm_channels.get(user_id)
+    if channel_id is None:
+        with rest_seconds.time("create_dm_channel"):
+            channel_id = (await bot.rest.create_dm_channel(user_id)).id
+        dm_channels.set(user_id, channel_id)
+    return channel_id
+
+
+async def get_guild_name(guild_id):
+    name = guild_names.get(guild_id)
+    if name is None:
+        guild = bot.cache.get_guild(guild_id)
+        if guild is None:
+            with rest_seconds.time("fetch_guild"):
+                guild = await bot.rest.fetch_guild(guild_id)
+        name = guild.name
+        guild_names.set(guild_id, name)
+    return name
+
+
+@bot.listen(hikari.GuildAvailableEvent)
+@bot.listen(hikari.GuildJoinEvent)
+@bot.listen(hikari.GuildUpdateEvent)
+async def on_guild_seen(event) -> None:
+    guild_names.set(event.guild_id, event.guild.name)
+
+
+@bot.listen(hikari.GuildLeaveEvent)
+async def on_guild_leave(event: hikari.GuildLeaveEvent) -> None:
+    guild_names.pop(event.guild_id)
+
+
+@bot.listen(hikari.DMMessageCreateEvent)
+async def on_dm_message(event: hikari.DMMessageCreateEvent) -> None:
+    if not event.is_bot:
+        dm_channels.set(event.author_id, event.channel_id)
+
+
+class TurnNotifier:
+    # "your turn" DMs are queued and sent by background workers so a slow or
+    # failing DM never holds up an interaction. pings for the same user that
+    # arrive within `window` seconds of each other are merged into one DM
+    def __init__(self, workers=2, window=5.0, interval=0.5, maxsize=1000):
+        self.workers = workers
+        self.window = window
+        self.interval = interval
+        self.maxsize = maxsize
+        self.queue = None
+        self.pending = {}
+        self.tasks = []
+
+    def start(self):
+        self.queue = asyncio.Queue(self.maxsize)
+        for _ in range(self.workers):
+            self.tasks.append(asyncio.create_task(self.work()))
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    def notify(self, user, message_id, guild_id, link):
+        games = self.pending.get(user)
+        if games is not None:
+            games[message_id] = (guild_id, link)
+            return
+        if self.queue is None:
+            return
+        try:
+            self.queue.put_nowait((time() + self.window, user))
+        except asyncio.QueueFull:
+            print(f"notification queue full, dropping ping for {user}")
+            return
+        self.pending[user] = {message_id: (guild_id, link)}
+
+    def discard(self, user, message_id):
+        games = self.pending.get(user)
+        if games is not None:
+            games.pop(message_id, None)
+
+    async def work(self):
+        while True:
+            (due, user) = await self.queue.get()
+            try:
+                # the queue is in due order, so nothing behind this is ready yet
+                if due > time():
+                    await asyncio.sleep(due - time())
+                games = list(self.pending.pop(user, {}).values())
+                if len(games) > 0 and await get_options(user, "dm_notifications"):
+                    await self.send(user, games)
+            except hikari.RateLimitTooLongError as e:
+                print(f"dm to {user} rate limited, backing off {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+            except hikari.ForbiddenError:
+                pass
+            except Exception as e:
+                print(f"failed to dm {user}: {e!r}")
+            finally:
+                self.queue.task_done()
+            await asyncio.sleep(self.interval)
+
+    async def send(self, user, games):
+        rows = []
+        for (i, (guild_id, link)) in enumerate(games[:25]):
+            if (i % 5) == 0:
+                rows.append(bot.rest.build_action_row())
+            label = "Jump to game!"
+            if len(games) > 1:
+                label = f"Jump to game in {await get_guild_name(guild_id)}"[:80]
+            rows[-1].add_button(hikari.ButtonStyle.LINK, link).set_label(
+                label
+            ).add_to_container()
+        if len(games) == 1:
+            where = await get_guild_name(games[0][0])
+        else:
+            where = f"{len(games)} games"
+        channel = await get_dm_channel(user)
+        with rest_seconds.time("create_message"):
+            await bot.rest.create_message(
+                channel,
+                f"It's your turn in {where}!\n`psst, dont like the dms? turn off dms with /settings`",
+                components=rows,
+            )
+
+
+notifier = TurnNotifier()
+metrics.Gauge(
+    "quiggle_dm_queue_depth",
+    "Turn notification DMs waiting to be sent",
+    lambda: 0 if notifier.queue is None else notifier.queue.qsize(),
+)
+metrics_server = None
+
+
+@bot.listen(hikari.StartedEvent)
+async def on_started(event: hikari.StartedEvent) -> None:
+    global metrics_server
+    notifier.start()
+    if state_store is not None:
+        state_store.start()
+    if config.get("metrics_port") is not None:
+        metrics_server = await metrics.serve(config["metrics_port"])
+    slow_log.start()
+    await asyncio.gather(*(worker.start() for worker in ai_workers))
+
+
+@bot.listen(hikari.StoppingEvent)
+async def on_stopping(event: hikari.StoppingEvent) -> None:
+    notifier.stop()
+    slow_log.stop()
+    for worker in ai_workers:
+        worker.stop()
+    if metrics_server is not None:
+        metrics_server.close()
+    if state_store is not None:
+        await state_store.stop()
+    # let any queued leaderboard writes land before the process exits
+    await asyncio.get_running_loop().run_in_executor(None, db_executor.shutdown)
+
+
 @bot.command
 @lightbulb.option(
     "user", "User you would like to invite!", required=True, type=hikari.OptionType.USER
 )
 @lightbulb.command("tictactoe", f"Invite a user to play {readable['TicTacToe']}!")
 @lightbulb.implements(lightbulb.SlashCommand)
+@watched
 async def TicTacToeCommand(ctx: lightbulb.SlashContext) -> None:
     if ctx.author.is_bot:
         await ctx.respond("Sorry, you're a bot", flags=hikari.MessageFlag.EPHEMERAL)
@@ -1534,14 +1777,28 @@ async def TicTacToeCommand(ctx: lightbulb.SlashContext) -> None:
 
 @bot.command
 @lightbulb.option(
-    "user", "User you would like to invite!", required=True, type=hikari.OptionType.USER
+    "user",
+    "User you would like to invite, or me to play against the computer!",
+    required=True,
+    type=hikari.OptionType.USER,
 )
 @lightbulb.command("ulttictactoe", f"Invite a user to play {readable['UltTicTacToe']}!")
 @lightbulb.implements(lightbulb.SlashCommand)
+@watched
 async def UltTicTacToeCommand(ctx: lightbulb.SlashContext) -> None:
     if ctx.author.is_bot:
         await ctx.respond("Sorry, you're a bot", flags=hikari.MessageFlag.EPHEMERAL)
         return
+    if is_computer(ctx.options.user.id):
+        # no invite, the computer always accepts
+        game = UltTicTacToe([ctx.author.id, ctx.options.user.id], ctx.guild_id)
+        if is_computer(game.players[game.turn]):
+            # the middle of the middle board, no need to search
+            for click in game.computer_clicks((4, 4)):
+                game.make_move(click)
+        message = game.build_message()
+        await ctx.respond(message["text"], components=message["components"])
+        return
     if ctx.options.user.is_bot:
         await ctx.respond(
             "You can't play against a bot", flags=hikari.MessageFlag.EPHEMERAL
@@ -1567,14 +1824,27 @@ async def UltTicTacToeCommand(ctx: lightbulb.SlashContext) -> None:
 
 @bot.command
 @lightbulb.option(
-    "user", "User you would like to invite!", required=True, type=hikari.OptionType.USER
+    "user",
+    "User you would like to invite, or me to play against the computer!",
+    required=True,
+    type=hikari.OptionType.USER,
 )
 @lightbulb.command("connectfour", f"Invite a user to play {readable['ConnectFour']}!")
 @lightbulb.implements(lightbulb.SlashCommand)
+@watched
 async def ConnectFourCommand(ctx: lightbulb.SlashContext) -> None:
     if ctx.author.is_bot:
         await ctx.respond("Sorry, you're a bot", flags=hikari.MessageFlag.EPHEMERAL)
         return
+    if is_computer(ctx.options.user.id):
+        # no invite, the computer always accepts
+        game = ConnectFour([ctx.author.id, ctx.options.user.id], ctx.guild_id)
+        if is_computer(game.players[game.turn]):
+            # the middle column is the best first move, no need to search
+            game.make_move(str(game.width // 2))
+        message = game.build_message()
+        await ctx.respond(message["text"], components=message["components"])
+        return
     if ctx.options.user.is_bot:
         await ctx.respond(
             "You can't play against a bot", flags=hikari.MessageFlag.EPHEMERAL
@@ -1604,6 +1874,7 @@ async def ConnectFourCommand(ctx: lightbulb.SlashContext) -> None:
 )
 @lightbulb.command("battleship", f"Invite a user to play {readable['Battleship']}!")
 @lightbulb.implements(lightbulb.SlashCommand)
+@watched
 async def BattleshipCommand(ctx: lightbulb.SlashContext) -> None:
     if ctx.author.is_bot:
         await ctx.respond("Sorry, you're a bot", flags=hikari.MessageFlag.EPHEMERAL)
@@ -1633,14 +1904,32 @@ async def BattleshipCommand(ctx: lightbulb.SlashContext) -> None:
 
 @bot.command
 @lightbulb.option(
-    "user", "User you would like to invite!", required=True, type=hikari.OptionType.USER
+    "user",
+    "User you would like to invite, or me to play against the computer!",
+    required=True,
+    type=hikari.OptionType.USER,
 )
 @lightbulb.command("chess", f"Invite a user to play {readable['Chess']}!")
 @lightbulb.implements(lightbulb.SlashCommand)
+@watched
 async def ChessCommand(ctx: lightbulb.SlashContext) -> None:
     if ctx.author.is_bot:
         await ctx.respond("Sorry, you're a bot", flags=hikari.MessageFlag.EPHEMERAL)
         return
+    if is_computer(ctx.options.user.id):
+        # no invite, the computer always accepts
+        game = Chess([ctx.author.id, ctx.options.user.id], ctx.guild_id)
+        if is_computer(game.players[game.turn]):
+            # opening with the king's pawn needs no search
+            for click in game.computer_clicks("e2e4"):
+                game.make_move(click)
+        message = game.build_message()
+        await ctx.respond(
+            message["text"],
+            embed=message["embed"],
+            components=message["components"],
+        )
+        return
     if ctx.options.user.is_bot:
         await ctx.respond(
             "You can't play against a bot", flags=hikari.MessageFlag.EPHEMERAL
@@ -1670,6 +1959,7 @@ if dev:
     @lightbulb.option("gamedatastring", "data string to load game for", required=True)
     @lightbulb.command("loadgame", f"load a game from a string")
     @lightbulb.implements(lightbulb.SlashCommand)
+    @watched
     async def LoadMessageCommand(ctx: lightbulb.SlashContext) -> None:
         if dev:
             try:
@@ -1692,6 +1982,7 @@ if dev:
     @bot.command
     @lightbulb.command("test", "test")
     @lightbulb.implements(lightbulb.MessageCommand)
+    @watched
     async def testcommand(ctx: lightbulb.MessageContext) -> None:
         await ctx.respond(await ctx.options.target.delete())
 
@@ -1700,85 +1991,218 @@ else:
     @bot.listen(hikari.events.ExceptionEvent)
     async def on_exception(event: hikari.ExceptionEvent):
 
-        set_options(time(), "LOG", f'"{event.exception}"')
+        await log_exception(event.exception)
 
 
 @bot.listen(hikari.InteractionCreateEvent)
 async def on_component_interaction(event: hikari.InteractionCreateEvent) -> None:
     if not isinstance(event.interaction, hikari.ComponentInteraction):
         return
-
-    data = decode(
-        event.interaction.message.content.split("```")[1].split("[")[0].strip()
+    interaction = event.interaction
+    if interaction.id in seen_interactions:
+        interactions.inc("unknown", "redelivered")
+        return
+    seen_interactions.set(interaction.id, True)
+    click = (
+        interaction.message.id,
+        interaction.user.id,
+        interaction.custom_id,
+        tuple(interaction.values),
+        hash(interaction.message.content),
     )
-    if event.interaction.user.id in data["players"]:
+    if click in pending_clicks:
+        interactions.inc("unknown", "duplicate")
+        await acknowledge(interaction)
+        return
+    pending_clicks.add(click)
+    received = perf_counter()
+    try:
+        # whatever holds the lock (a computer move, a slow edit) can take longer
+        # than discord waits for an answer, so a queued click is answered first
+        acknowledged = message_locks.busy(interaction.message.id)
+        if acknowledged:
+            deferred_responses.inc("unknown")
+            await acknowledge(interaction)
+        async with message_locks.hold(interaction.message.id):
+            with slow_log.watch(interaction.custom_id) as trace:
+                await handle_component_interaction(
+                    event, trace, received, acknowledged
+                )
+    finally:
+        pending_clicks.discard(click)
+
+
+async def play_computer(interaction, game, message_id):
+    # the computer's reply to a move, shown by editing the message the click
+    # already answered. the message lock is still held, clicks that queue up
+    # behind it are acknowledged right away and then dropped as stale
+    name = type(game).__name__
+    (search, *args) = game.computer_search()
+    worker = ai_workers[message_id % len(ai_workers)]
+    try:
+        with computer_seconds.time(name):
+            move = await worker.run(search, *args)
+    except Exception as e:
+        # a crashed or stuck worker still has to leave a move behind
+        print(f"computer move for {name} failed: {e!r}")
+        await log_exception(e)
+        move = None
+    if move is not None:
+        for click in game.computer_clicks(move):
+            game.make_move(click)
+    fallback = computer_to_move(game)
+    if fallback:
+        interactions.inc(name, "computer_fallback")
+        for click in game.computer_clicks(game.random_move()):
+            game.make_move(click)
+    message = game.build_message()
+    await respond(interaction, message, True)
+    track_message(message_id, game, message["text"])
+    if state_store is not None and game.winner is not None:
+        state_store.drop(message_id)
+    if fallback:
+        await respond(
+            interaction,
+            {
+                "text": "The computer couldn't come up with a move, "
+                "so it played a random one!",
+                "responsetype": hikari.ResponseType.MESSAGE_CREATE,
+            },
+            True,
+        )
+
+
+async def handle_component_interaction(event, trace, received, acknowledged):
+    start = trace.start
+    message_id = event.interaction.message.id
+    state = get_state_string(event.interaction.message.content)
+    latest = latest_messages.get(message_id)
+    version = message_version(event.interaction.message.content, state)
+    if latest is not None and latest[0] != version:
+        # the message was edited after this click was made. battleship players
+        # act at the same time so their clicks apply to the newest state, in
+        # the other games the click was made on a board that no longer exists.
+        # a server side state is the same game as the newest one, anything else
+        # has its type in the header. a forfeit game has no newest state at all
+        if state.startswith("#"):
+            clicked = latest[2]
+        else:
+            clicked = game_type(state)
+        if latest[1] is None or not hasattr(getClass(clicked), "handlemsg"):
+            interactions.inc(clicked, "stale")
+            if not acknowledged:
+                await acknowledge(event.interaction)
+            return
+        state = latest[1]
+    game = await load_game(message_id, state, event.interaction.user.id)
+    name = type(game).__name__
+    trace.name = f"{name} {event.interaction.custom_id}"
+    observe_phase(trace, name, "decode", start)
+    if event.interaction.user.id in game.players:
         ping = False
-        if data.get("type") == "Invite":
-            if event.interaction.user.id == data["players"][1]:
+        # whoever is clicking is clearly already looking at the game
+        notifier.discard(event.interaction.user.id, message_id)
+        key = (name, "select" if event.interaction.values else "button")
+        deferred = acknowledged
+        if not deferred and deadline.should_defer(key, perf_counter() - received):
+            deferred = True
+            deferred_responses.inc(name)
+            await acknowledge(event.interaction)
+        phase = perf_counter()
+        work = phase
+        if isinstance(game, Invite):
+            if event.interaction.user.id == game.players[1]:
                 if event.interaction.custom_id == "yes":
-                    gameclass = getClass(data["game"])
+                    gameclass = getClass(game.game)
                     if not hasattr(gameclass, "handlemsg"):
                         ping = True
-                    game = gameclass(data["players"], data["guild_id"])
+                    game = gameclass(game.players, game.guild_id)
                 else:
-                    await event.interaction.message.delete()
+                    interactions.inc(name, "declined")
+                    with rest_seconds.time("delete_message"):
+                        await event.interaction.message.delete()
                     return
             else:
-                await event.interaction.create_initial_response(
-                    hikari.ResponseType.MESSAGE_CREATE,
-                    "You're the inviter, silly!",
-                    flags=hikari.MessageFlag.EPHEMERAL,
+                interactions.inc(name, "inviter")
+                await respond(
+                    event.interaction,
+                    {
+                        "text": "You're the inviter, silly!",
+                        "responsetype": hikari.ResponseType.MESSAGE_CREATE,
+                    },
+                    deferred,
                 )
                 return
         else:
-            gameclass = getClass(data["type"])
-            if hasattr(gameclass, "handlemsg"):
-                game = gameclass.load_data(data, event.interaction.user.id)
+            if hasattr(type(game), "handlemsg"):
                 ping = game.make_move(event.interaction.custom_id)
             else:
-                game = gameclass.load_data(data)
                 if event.interaction.user.id == game.players[game.turn]:
                     if "select" in event.interaction.custom_id:
                         ping = game.make_move(event.interaction.values[0])
                     else:
                         ping = game.make_move(event.interaction.custom_id)
+                elif computer_to_move(game):
+                    # the computer's last move never made it into the message
+                    interactions.inc(name, "computer_retry")
+                    if not deferred:
+                        await acknowledge(event.interaction)
+                    game.message_id = message_id
+                    await play_computer(event.interaction, game, message_id)
+                    return
                 else:
-                    await event.interaction.create_initial_response(
-                        hikari.ResponseType.MESSAGE_CREATE,
-                        "It isnt your turn!",
-                        flags=hikari.MessageFlag.EPHEMERAL,
+                    keep_game(message_id, state, game)
+                    interactions.inc(name, "not_turn")
+                    await respond(
+                        event.interaction,
+                        {
+                            "text": "It isnt your turn!",
+                            "responsetype": hikari.ResponseType.MESSAGE_CREATE,
+                        },
+                        deferred,
                     )
                     return
+        observe_phase(trace, name, "move", phase)
+        phase = perf_counter()
+        game.message_id = message_id
         message = game.build_message()
+        observe_phase(trace, name, "render", phase)
+        deadline.record(key, perf_counter() - work)
         if dev:
             print(len(message["text"]))
-        await event.interaction.create_initial_response(
-            message.get("responsetype", hikari.ResponseType.MESSAGE_UPDATE),
-            message["text"],
-            embed=message.get("embed", hikari.UNDEFINED),
-            embeds=message.get("embeds", hikari.UNDEFINED),
-            flags=message.get("flags", hikari.MessageFlag.EPHEMERAL),
-            components=message.get("components", []),
-        )
-        if ping:
-            if get_options(game.players[game.turn], "dm_notifications"):
-                components = bot.rest.build_action_row()
-                l = components.add_button(
-                    hikari.ButtonStyle.LINK,
-                    event.interaction.message.make_link(int(data["guild_id"])),
-                )
-                l.set_label("Jump to game!")
-                l.add_to_container()
-                await (await bot.rest.fetch_user(int(game.players[game.turn]))).send(
-                    f"It's your turn in {(await bot.rest.fetch_guild(int(data['guild_id']))).name}!\n`psst, dont like the dms? turn off dms with /settings`",
-                    components=[components],
-                )
-            pass
+        phase = perf_counter()
+        await respond(event.interaction, message, deferred)
+        observe_phase(trace, name, "respond", phase)
+        if "responsetype" not in message:
+            newstate = track_message(message_id, game, message["text"])
+            state_size.observe(len(newstate) / 2000, type(game).__name__)
+            message_size.observe(len(message["text"]) / 2000, type(game).__name__)
+        elif encode(game.get_data()) == peek_state(state):
+            # answered with a separate message, the game message is unchanged
+            keep_game(message_id, state, game)
+        if state_store is not None and game.winner is not None:
+            state_store.drop(message_id)
+        if ping and not is_computer(game.players[game.turn]):
+            notifier.notify(
+                game.players[game.turn],
+                message_id,
+                int(game.guild_id),
+                event.interaction.message.make_link(int(game.guild_id)),
+            )
+        interactions.inc(name, "move")
+        interaction_seconds.observe(perf_counter() - start, name, "total")
+        if computer_to_move(game):
+            await play_computer(event.interaction, game, message_id)
     else:
-        await event.interaction.create_initial_response(
-            hikari.ResponseType.MESSAGE_CREATE,
-            "You are not in this game!",
-            flags=hikari.MessageFlag.EPHEMERAL,
+        keep_game(message_id, state, game)
+        interactions.inc(name, "not_player")
+        await respond(
+            event.interaction,
+            {
+                "text": "You are not in this game!",
+                "responsetype": hikari.ResponseType.MESSAGE_CREATE,
+            },
+            acknowledged,
         )
 
 
@@ -1792,8 +2216,9 @@ for i in setting_defaults.keys():
 @lightbulb.option("type", "setting", choices=choices)
 @lightbulb.command("settings", "change quiggle settings")
 @lightbulb.implements(lightbulb.SlashCommand)
+@watched
 async def setsetting(ctx: lightbulb.SlashContext):
-    set_options(ctx.author.id, ctx.options.type, ctx.options.value)
+    await set_options(ctx.author.id, ctx.options.type, ctx.options.value)
     await ctx.respond(
         f"Setting updated!\n`{ctx.options.type}: {ctx.options.value}`",
         flags=hikari.MessageFlag.EPHEMERAL,
@@ -1803,6 +2228,7 @@ async def setsetting(ctx: lightbulb.SlashContext):
 @bot.command
 @lightbulb.command("invite", "recieve a link to invite the bot to your server!")
 @lightbulb.implements(lightbulb.SlashCommand)
+@watched
 async def invitecommand(ctx: lightbulb.SlashContext) -> None:
     components = []
     r = bot.rest.build_action_row()
@@ -1821,6 +2247,7 @@ async def invitecommand(ctx: lightbulb.SlashContext) -> None:
 )
 @lightbulb.command("wins", "Get amount of wins for a user")
 @lightbulb.implements(lightbulb.SlashCommand)
+@watched
 async def winscommand(ctx: lightbulb.SlashContext) -> None:
     user = ctx.author.id
     if ctx.options.user is not None:
@@ -1840,6 +2267,7 @@ for i in readable.keys():
 @lightbulb.option("game", "Game to get leaderboard for", required=True, choices=choices)
 @lightbulb.command("leaderboard", "Get leaderboard for game")
 @lightbulb.implements(lightbulb.SlashCommand)
+@watched
 async def winscommand(ctx: lightbulb.SlashContext) -> None:
 
     winstring = get_leaderboard_string_for_game(ctx.options.game)
@@ -1851,6 +2279,7 @@ async def winscommand(ctx: lightbulb.SlashContext) -> None:
 @bot.command
 @lightbulb.command("forfeit", "Forfeit a game you are a part of")
 @lightbulb.implements(lightbulb.MessageCommand)
+@watched
 async def forfeitcommand(ctx: lightbulb.MessageContext) -> None:
     message = ctx.options.target
     if message.author.id != bot.application.id:
@@ -1858,24 +2287,42 @@ async def forfeitcommand(ctx: lightbulb.MessageContext) -> None:
             "Thats not a quiggle you little goober!", flags=hikari.MessageFlag.EPHEMERAL
         )
         return
-    try:
-        data = decode(message.content.split("```")[1].split("[")[0].strip())
-    except:
-        await ctx.respond("This isnt a valid game", flags=hikari.MessageFlag.EPHEMERAL)
-        return
-    if ctx.author.id in data["players"]:
-        await message.edit(
-            f"<@{ctx.author.id}> forfeit a game of {readable[data['type']]}",
-            components=None,
-            embeds=None,
-        )
-        await ctx.respond("Game forfeit!", flags=hikari.MessageFlag.EPHEMERAL)
+    # under the message lock so a move (or the computer's reply) can't land
+    # after the forfeit and bring the game back
+    async with message_locks.hold(message.id):
+        latest = latest_messages.get(message.id)
+        try:
+            if latest is None:
+                state = get_state_string(message.content)
+            else:
+                # the message may have been edited since the command was opened
+                state = latest[1]
+            game = await load_game(message.id, state, ctx.author.id)
+        except:
+            await ctx.respond(
+                "This isnt a valid game", flags=hikari.MessageFlag.EPHEMERAL
+            )
+            return
+        if ctx.author.id not in game.players:
+            keep_game(message.id, state, game)
+            return
+        gametype = type(game).__name__
+        if isinstance(game, Invite):
+            gametype = game.game
+        text = f"<@{ctx.author.id}> forfeit a game of {readable[gametype]}"
+        await message.edit(text, components=None, embeds=None)
+        if state_store is not None:
+            state_store.drop(message.id)
+        # no state left, clicks still queued on the lock are dropped as stale
+        latest_messages.set(message.id, (hash(text), None, type(game).__name__))
+    await ctx.respond("Game forfeit!", flags=hikari.MessageFlag.EPHEMERAL)
 
 
 @bot.command
 @lightbulb.option("game", "Game to get Rules for", required=False, choices=choices)
 @lightbulb.command("help", "Get general command info, or rules for a game!")
 @lightbulb.implements(lightbulb.SlashCommand)
+@watched
 async def helpcommand(ctx: lightbulb.SlashContext):
     message = ""
     if ctx.options.game is not None:
@@ -1891,4 +2338,5 @@ async def helpcommand(ctx: lightbulb.SlashContext):
     await ctx.respond(message, flags=hikari.MessageFlag.EPHEMERAL)
 
 
-bot.run()
+if __name__ == "__main__":
+    bot.run()
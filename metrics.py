@@ -0,0 +1,147 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+import asyncio
+
+# just enough of prometheus for one process: counters, gauges and histograms
+# with labels, rendered in the text exposition format and served over plain
+# http on a local port. histograms can be fed from the db thread, so updates
+# take a lock
+
+TIMES = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+registry = []
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = Lock()
+        registry.append(self)
+
+    def label_string(self, values, extra=()):
+        pairs = list(zip(self.labels, values)) + list(extra)
+        if len(pairs) == 0:
+            return ""
+        return "{" + ",".join(f'{k}="{escape(v)}"' for (k, v) in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            lines += self.samples()
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        labels = tuple(str(label) for label in labels)
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        return [
+            f"{self.name}{self.label_string(labels)} {value}"
+            for (labels, value) in sorted(self.values.items())
+        ]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    # read when scraped instead of being kept up to date
+    def __init__(self, name, help, func):
+        super().__init__(name, help)
+        self.func = func
+
+    def samples(self):
+        return [f"{self.name} {self.func()}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=TIMES):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        labels = tuple(str(label) for label in labels)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = [[0] * len(self.buckets), 0.0, 0]
+                self.values[labels] = entry
+            i = bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, *labels)
+
+    def samples(self):
+        lines = []
+        for (labels, (counts, total, count)) in sorted(self.values.items()):
+            cumulative = 0
+            for (bound, n) in zip(self.buckets, counts):
+                cumulative += n
+                le = self.label_string(labels, [("le", bound)])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = self.label_string(labels, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{self.label_string(labels)} {total}")
+            lines.append(f"{self.name}_count{self.label_string(labels)} {count}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+async def handle(reader, writer):
+    try:
+        request = (await reader.readline()).split()
+        while (await reader.readline()).strip():
+            pass
+        if len(request) > 1 and request[1] == b"/metrics":
+            status = "200 OK"
+            body = render().encode("utf-8")
+        else:
+            status = "404 Not Found"
+            body = b"not found\n"
+        writer.write(
+            f"HTTP/1.0 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("ascii")
+            + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(port, host="127.0.0.1"):
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,162 @@
+from collections import Counter, deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from time import perf_counter, sleep
+import logging
+import os
+import sys
+import threading
+
+# profiles of slow handlers. while any watched handler is running a background
+# thread samples the event loop thread's stack every few ms, and when one of
+# them takes longer than the threshold its phase timings and the most common
+# frames from its window are written to a rotating log file. samples are of the
+# whole loop thread, so anything else running at the same time shows up too
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.phases = []
+        self.start = perf_counter()
+
+    def phase(self, name, seconds):
+        self.phases.append((name, seconds))
+
+
+class SlowLog:
+    def __init__(
+        self,
+        threshold=None,
+        path="./slow.log",
+        interval=0.005,
+        every=60.0,
+        depth=32,
+        keep=4000,
+    ):
+        # threshold is in seconds, None turns profiling off. every is the least
+        # time between two written profiles
+        self.threshold = threshold
+        self.path = path
+        self.interval = interval
+        self.every = every
+        self.depth = depth
+        self.samples = deque(maxlen=keep)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.wake = threading.Event()
+        self.running = False
+        self.thread = None
+        self.target = None
+        self.last_dump = None
+        self.logger = None
+
+    def start(self):
+        # call from the event loop thread, that's the one that gets sampled
+        if self.threshold is None or self.running:
+            return
+        self.logger = logging.getLogger("quiggle.slow")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        handler = RotatingFileHandler(self.path, maxBytes=1 << 20, backupCount=3)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self.logger.addHandler(handler)
+        self.target = threading.get_ident()
+        self.running = True
+        self.thread = threading.Thread(
+            target=self.sample_loop, name="quiggle-sampler", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.logger is not None:
+            for handler in list(self.logger.handlers):
+                self.logger.removeHandler(handler)
+                handler.close()
+
+    def sample_loop(self):
+        while self.running:
+            self.wake.wait()
+            if not self.running:
+                return
+            frame = sys._current_frames().get(self.target)
+            if frame is not None:
+                stack = []
+                while frame is not None and len(stack) < self.depth:
+                    stack.append((frame.f_code, frame.f_lineno))
+                    frame = frame.f_back
+                # drop the reference before sleeping, the frames hold locals
+                frame = None
+                with self.lock:
+                    self.samples.append((perf_counter(), tuple(stack)))
+            sleep(self.interval)
+
+    @contextmanager
+    def watch(self, name):
+        trace = Trace(name)
+        if not self.running:
+            yield trace
+            return
+        with self.lock:
+            self.active += 1
+        self.wake.set()
+        try:
+            yield trace
+        finally:
+            end = perf_counter()
+            with self.lock:
+                self.active -= 1
+                if self.active == 0:
+                    self.wake.clear()
+            elapsed = end - trace.start
+            if elapsed > self.threshold and (
+                self.last_dump is None or end - self.last_dump >= self.every
+            ):
+                self.last_dump = end
+                self.dump(trace, end)
+            with self.lock:
+                if self.active == 0:
+                    self.samples.clear()
+
+    def dump(self, trace, end):
+        with self.lock:
+            stacks = [s for (t, s) in self.samples if trace.start <= t <= end]
+        elapsed = end - trace.start
+        lines = [
+            f"slow: {trace.name} took {elapsed:.3f}s (threshold {self.threshold:.3f}s)"
+        ]
+        if trace.phases:
+            parts = [f"{name} {seconds:.3f}s" for (name, seconds) in trace.phases]
+            other = elapsed - sum(seconds for (_, seconds) in trace.phases)
+            parts.append(f"other {other:.3f}s")
+            lines.append("  phases: " + ", ".join(parts))
+        lines.append(
+            f"  {len(stacks)} samples of the event loop thread, "
+            f"one every {self.interval * 1000:.0f}ms"
+        )
+        if stacks:
+            inclusive = Counter()
+            leaves = Counter()
+            for stack in stacks:
+                inclusive.update({describe(code) for (code, _) in stack})
+                (code, line) = stack[0]
+                leaves[describe(code, line)] += 1
+            lines.append("  top frames (anywhere on the stack):")
+            for (where, n) in inclusive.most_common(15):
+                lines.append(f"    {n * 100 / len(stacks):5.1f}%  {where}")
+            lines.append("  top frames (innermost):")
+            for (where, n) in leaves.most_common(10):
+                lines.append(f"    {n * 100 / len(stacks):5.1f}%  {where}")
+        self.logger.info("\n".join(lines))
+
+
+def describe(code, line=None):
+    name = os.path.basename(code.co_filename)
+    if line is None:
+        line = code.co_firstlineno
+    return f"{name}:{line} {code.co_name}"
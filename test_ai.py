@@ -0,0 +1,55 @@
+from random import Random
+import chess
+import ai
+import engines
+
+# the per game caches a worker keeps between moves, checked by playing games
+# through the searches the way a game's pinned worker sees them. run with
+#
+#   python -m pytest -q
+
+PLAYERS = [1000000000000000001, 1000000000000000002]
+GUILD = 1000000000000000003
+
+
+def human_move(game, rng):
+    # random clicks until the turn passes, picking a board is a click of its own
+    turn = game.turn
+    while game.winner is None and game.turn == turn:
+        game.make_move(rng.choice(game.get_moves()))
+
+
+def test_ult_tree_found_next_turn():
+    rng = Random(0)
+    game = engines.UltTicTacToe(PLAYERS, GUILD, 0)
+    found = []
+    while game.winner is None:
+        human_move(game, rng)
+        if game.winner is not None:
+            break
+        forced = game.current() if game.currentboard[0] is not None else None
+        (board, cell) = ai.ult_tic_tac_toe_move(
+            game.bits, game.metabits, forced, game.turn, 0.05, "ult"
+        )
+        found.append(ai.REUSED["ult_tree"])
+        if game.currentboard[0] is None:
+            game.make_move(engines.CELL_MOVES[board])
+        game.make_move(engines.CELL_MOVES[cell])
+    # nothing kept for the first move, the tree from the move before after that
+    assert found[0] is False
+    assert all(found[1:])
+    # and another game doesn't pick it up
+    ai.ult_tic_tac_toe_move([0, 0], [0, 0, 0], None, 1, 0.01, "other")
+    assert ai.REUSED["ult_tree"] is False
+
+
+def test_chess_table_found_next_turn():
+    rng = Random(0)
+    board = chess.Board()
+    found = []
+    for _ in range(4):
+        board.push(rng.choice(list(board.legal_moves)))
+        move = ai.chess_move(board.fen(), 0.05, "chess")
+        found.append(ai.REUSED["chess_table"])
+        board.push(chess.Move.from_uci(move))
+    assert found == [False, True, True, True]
@@ -0,0 +1,368 @@
+from json import dumps as jdumps
+from random import Random
+from zlib import compress as zcompress
+import random
+import chess
+import pytest
+import codec
+import engines
+from codec import encode, decode, game_type
+
+# the packed engines and the state codec checked against plain list based
+# versions of the same rules, over seeded random games. run with
+#
+#   python -m pytest -q
+
+PLAYERS = [1000000000000000001, 1000000000000000002]
+GUILD = 1000000000000000003
+SEEDS = range(100)
+LINES = [
+    (0, 1, 2),
+    (3, 4, 5),
+    (6, 7, 8),
+    (0, 3, 6),
+    (1, 4, 7),
+    (2, 5, 8),
+    (0, 4, 8),
+    (2, 4, 6),
+]
+
+
+def line_winner(cells):
+    # a mark (or 2 for tied boards) that fills a line of a 9 cell list
+    for (a, b, c) in LINES:
+        if cells[a] is not None and cells[a] == cells[b] == cells[c]:
+            return cells[a]
+    return None
+
+
+def cell_move(i):
+    return f"{i % 3}|{i // 3}"
+
+
+class ReferenceTicTacToe:
+    def __init__(self, turn):
+        self.turn = turn
+        self.cells = [None] * 9
+        self.winner = None
+
+    def get_moves(self):
+        return [cell_move(i) for i in range(9) if self.cells[i] is None]
+
+    def make_move(self, move):
+        if self.winner is not None or move not in self.get_moves():
+            return False
+        (x, y) = move.split("|")
+        self.cells[int(y) * 3 + int(x)] = self.turn
+        self.winner = line_winner(self.cells)
+        if self.winner is None and None not in self.cells:
+            self.winner = 2
+        if self.winner is not None:
+            return False
+        self.turn = (self.turn + 1) % 2
+        return True
+
+
+class ReferenceUltTicTacToe:
+    def __init__(self, turn):
+        self.turn = turn
+        # sub-board n is board row n // 3, column n % 3
+        self.cells = [[None] * 9 for _ in range(9)]
+        self.meta = [None] * 9
+        self.current = None
+        self.winner = None
+
+    def get_moves(self):
+        if self.current is None:
+            return [cell_move(n) for n in range(9) if self.meta[n] is None]
+        cells = self.cells[self.current]
+        return [cell_move(i) for i in range(9) if cells[i] is None]
+
+    def make_move(self, move):
+        if self.winner is not None or move not in self.get_moves():
+            return False
+        (x, y) = move.split("|")
+        cell = int(y) * 3 + int(x)
+        picking = self.current is None
+        if not picking:
+            cells = self.cells[self.current]
+            cells[cell] = self.turn
+            self.meta[self.current] = line_winner(cells)
+            if self.meta[self.current] is None and None not in cells:
+                self.meta[self.current] = 2
+        self.winner = line_winner(self.meta)
+        if self.winner is None and None not in self.meta:
+            self.winner = 2
+        self.current = cell if self.meta[cell] is None else None
+        if self.winner is not None or picking:
+            return False
+        self.turn = (self.turn + 1) % 2
+        return True
+
+
+class ReferenceConnectFour:
+    def __init__(self, turn, width=7, height=6):
+        self.turn = turn
+        self.board = [[None] * height for _ in range(width)]
+        self.winner = None
+
+    def get_moves(self):
+        return [i for (i, column) in enumerate(self.board) if None in column]
+
+    def make_move(self, move):
+        move = int(move)
+        if self.winner is not None or move not in self.get_moves():
+            return False
+        column = self.board[move]
+        column[column.index(None)] = self.turn
+        # every four in a row anywhere on the board
+        (width, height) = (len(self.board), len(column))
+        for x in range(width):
+            for y in range(height):
+                for (dx, dy) in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                    line = [(x + dx * i, y + dy * i) for i in range(4)]
+                    if all(0 <= a < width and 0 <= b < height for (a, b) in line):
+                        marks = {self.board[a][b] for (a, b) in line}
+                        if marks == {self.turn}:
+                            self.winner = self.turn
+        if self.winner is None and not self.get_moves():
+            self.winner = 2
+        if self.winner is not None:
+            return False
+        self.turn = (self.turn + 1) % 2
+        return True
+
+
+def play(engine, reference, rng, check, every):
+    # random legal moves until the game ends, comparing after every one
+    while reference.winner is None:
+        moves = reference.get_moves()
+        assert sorted(map(str, engine.get_moves())) == sorted(map(str, moves))
+        move = rng.choice(moves)
+        assert engine.make_move(str(move)) == reference.make_move(move)
+        assert engine.winner == reference.winner
+        assert engine.turn == reference.turn
+        check(engine, reference)
+    # and nothing is accepted once it's over
+    for move in every:
+        assert engine.make_move(move) is False
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_tictactoe_matches_reference(seed):
+    rng = Random(seed)
+    turn = rng.randint(0, 1)
+
+    def check(engine, reference):
+        assert [c for row in engine.board for c in row] == reference.cells
+
+    play(
+        engines.TicTacToe(PLAYERS, GUILD, turn),
+        ReferenceTicTacToe(turn),
+        rng,
+        check,
+        engines.CELL_MOVES,
+    )
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_ulttictactoe_matches_reference(seed):
+    rng = Random(seed)
+    turn = rng.randint(0, 1)
+
+    def check(engine, reference):
+        # stored boards are board[column][row][y][x]
+        for n in range(9):
+            cells = engine.board[n % 3][n // 3]
+            assert [c for row in cells for c in row] == reference.cells[n]
+        assert [c for row in engine.boardwinners for c in row] == reference.meta
+        if reference.current is None:
+            assert engine.currentboard == [None, None]
+        else:
+            assert engine.current() == reference.current
+
+    play(
+        engines.UltTicTacToe(PLAYERS, GUILD, turn),
+        ReferenceUltTicTacToe(turn),
+        rng,
+        check,
+        engines.CELL_MOVES,
+    )
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_connectfour_matches_reference(seed):
+    rng = Random(seed)
+    turn = rng.randint(0, 1)
+    (width, height) = rng.choice([(7, 6), (7, 6), (5, 4), (10, 8)])
+
+    def check(engine, reference):
+        assert engine.board == reference.board
+        if engine.winner not in (None, 2):
+            # the highlighted pieces hold a winning line of the winner's
+            marked = {
+                (x, y)
+                for x in range(width)
+                for y in range(height)
+                if engine.winningpieces[x][y]
+            }
+            assert len(marked) >= 4
+            assert {engine.board[x][y] for (x, y) in marked} == {engine.winner}
+
+    board = [[None] * height for _ in range(width)]
+    play(
+        engines.ConnectFour(PLAYERS, GUILD, turn, board),
+        ReferenceConnectFour(turn, width, height),
+        rng,
+        check,
+        [str(i) for i in range(width)],
+    )
+
+
+def set_up_battleship(game, rng):
+    # places every ship for both players with random clicks
+    while game.setup:
+        player = rng.choice(
+            [p for p in range(2) if any(isinstance(s, int) for s in game.pieces[p])]
+        )
+        game.set_player(player)
+        game.make_move(f"x|{rng.randint(0, 9)}")
+        game.make_move(f"y|{rng.randint(0, 9)}")
+        game.make_move(f"d|{rng.randint(0, 3)}")
+        assert game.winner is None
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_battleship_matches_reference(seed):
+    rng = Random(seed)
+    random.seed(seed)
+    game = engines.Battleship(PLAYERS, GUILD)
+    set_up_battleship(game, rng)
+    for ships in game.pieces:
+        cells = [tuple(cell) for ship in ships for cell in ship]
+        assert len(cells) == len(set(cells)) == 17
+        assert all(0 <= x <= 9 and 0 <= y <= 9 for (x, y) in cells)
+    while game.winner is None:
+        attacker = game.turn
+        defender = (attacker + 1) % 2
+        shots = game.board[attacker]
+        (x, y) = rng.choice(
+            [(x, y) for x in range(10) for y in range(10) if shots[x][y] is None]
+        )
+        game.set_player(attacker)
+        game.make_move(f"x|{x}")
+        game.make_move(f"y|{y}")
+        ships = game.pieces[defender]
+        hit = any([x, y] in ship for ship in ships)
+        assert game.shot == hit
+        assert shots[x][y] == hit
+        sunk = None
+        for (n, ship) in enumerate(ships):
+            if [x, y] in ship and all(shots[a][b] for (a, b) in ship):
+                sunk = n
+        assert game.sunk == sunk
+        if all(shots[a][b] for ship in ships for (a, b) in ship):
+            assert game.winner == attacker
+        else:
+            assert game.winner is None
+            assert game.turn == defender
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_chess_moves_match_python_chess(seed):
+    rng = Random(seed)
+    game = engines.Chess(PLAYERS, GUILD)
+    board = chess.Board()
+    while game.winner is None:
+        moves = game.get_moves()
+        legal = {move.uci(): move for move in board.legal_moves}
+        targets = {}
+        for (origin, (name, options)) in moves.items():
+            piece = board.piece_type_at(chess.parse_square(origin))
+            assert name == game.names[piece]
+            for (uci, description) in options.items():
+                assert uci[:2] == origin
+                captured = board.piece_type_at(legal[uci].to_square)
+                if captured is None:
+                    assert description == "move"
+                else:
+                    assert description == f"capture {game.names[captured]}"
+            targets.update(options)
+        assert set(targets) == set(legal)
+        uci = rng.choice(sorted(legal))
+        game.make_move(uci[:2])
+        game.make_move(uci)
+        board.push(legal[uci])
+        assert game.chess.fen() == board.fen()
+        if board.is_checkmate():
+            # the side that just moved gave mate
+            assert game.winner == game.playermap[not board.turn]
+        elif board.is_game_over():
+            assert game.winner == 2
+        else:
+            assert game.winner is None
+
+
+def random_states(rng):
+    # get_data from every position of a few random games of each type
+    states = []
+    states.append(
+        {"type": "Invite", "players": PLAYERS, "game": "Chess", "guild_id": GUILD}
+    )
+    for cls in (engines.TicTacToe, engines.UltTicTacToe, engines.ConnectFour):
+        game = cls(PLAYERS, rng.choice([GUILD, None]), rng.randint(0, 1))
+        states.append(game.get_data())
+        while game.winner is None:
+            moves = game.get_moves()
+            game.make_move(str(rng.choice(moves)))
+            states.append(game.get_data())
+    game = engines.Battleship(PLAYERS, GUILD)
+    while game.setup:
+        states.append(game.get_data())
+        set_up_battleship(game, rng)
+    while game.winner is None:
+        states.append(game.get_data())
+        game.set_player(game.turn)
+        game.make_move(rng.choice(game.get_moves()))
+    states.append(game.get_data())
+    game = engines.Chess(PLAYERS, GUILD)
+    for _ in range(40):
+        if game.winner is not None:
+            break
+        moves = game.get_moves()
+        origin = rng.choice(sorted(moves))
+        game.make_move(origin)
+        states.append(game.get_data())
+        game.make_move(rng.choice(sorted(moves[origin][1])))
+        states.append(game.get_data())
+    return states
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_codec_round_trips(seed):
+    random.seed(seed)
+    for data in random_states(Random(seed)):
+        string = encode(data)
+        assert decode(string) == data
+        # every game type has a packer, none of them should need the fallback
+        assert codec.from_text(string)[1] == codec.TAGS[data["type"]]
+        assert game_type(string) == data["type"]
+
+
+def test_codec_reads_legacy_hex():
+    for data in random_states(Random(0)):
+        legacy = zcompress(bytes(jdumps(data), "utf-8")).hex()
+        assert decode(legacy) == data
+        assert game_type(legacy) == data["type"]
+
+
+def test_codec_generic_fallback():
+    # no packer for the type, and data a packer can't hold (a floating piece)
+    unknown = {"type": "Checkers", "players": PLAYERS, "board": [[1, None]]}
+    floating = engines.ConnectFour(PLAYERS, GUILD, 0).get_data()
+    floating["board"][0][3] = 1
+    for data in (unknown, floating):
+        string = encode(data)
+        assert codec.from_text(string)[1] == codec.GENERIC
+        assert decode(string) == data
+        assert game_type(string) == data["type"]